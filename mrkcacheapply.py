@@ -0,0 +1,517 @@
+'''
+#
+# Purpose:
+#
+# Shadow-table load of a cache table (MRKCACHEAPPLY=swap or delta)
+#
+# Instead of truncating the live table and dropping its indexes, the new
+# rows are loaded into a staging copy of the table (<table>_new).
+#
+# swap  : <table>_new is indexed and analyzed and then swapped in with
+#	  renames inside one transaction.  The previous generation is kept
+#	  as <table>_old so that it can be swapped back.
+#
+# delta : <table>_new is compared with the live table and only the rows
+#	  that differ are deleted from/inserted into the live table, in one
+#	  transaction.
+#
+# Uses environment variables to determine Server, Database and User
+#
+# Usage:
+#	mrkcacheapply.py -T table prepare
+#	mrkcacheapply.py -T table swap
+#	mrkcacheapply.py -T table rollback
+#	mrkcacheapply.py -T table delta
+#
+#	prepare  : create an empty <table>_new
+#	swap     : index/analyze <table>_new; <table> -> <table>_old, <table>_new -> <table>
+#	rollback : <table>_old -> <table> (the current <table> becomes <table>_old);
+#	           removes <table>.loaded.md5 so the next load is applied,
+#	           and the table's snapshots (<table>.*.snapshot)
+#	delta    : apply the differences between <table>_new and <table> to <table>
+#
+# Processing:
+#
+#	The staging table is created 'like' the live table.  swap() copies
+#	the live table's indexes, constraints, triggers, owner and grants to
+#	it; the index and constraint names carry the same _new/_old suffix as
+#	their table, so that the ${SCHEMADIR} index scripts keep working
+#	against the live table.  A name that would be too long with the
+#	suffix is shortened, with a hash of the name (see suffixed()).  Views that select from the live table are re-created so that
+#	they follow the swap rather than the renamed previous generation.
+#
+#	A table that is referenced by a foreign key cannot be swapped.
+#
+#	delta() matches rows on the table's natural key (deltaKeys) and
+#	compares every other column except the surrogate key and the audit
+#	columns, which each load stamps with its own date.  Rows are compared
+#	as sets.  New rows of a table with a surrogate key are numbered
+#	from max(key) + 1.
+#
+# History
+#
+'''
+
+import sys
+import os
+import re
+import hashlib
+import getopt
+import mgi_utils
+import db
+
+try:
+    schema = os.environ['PG_DB_SCHEMA']
+except:
+    schema = 'mgd'
+
+NEW = '_new'
+OLD = '_old'
+
+# the longest identifier postgres keeps (NAMEDATALEN - 1)
+maxNameLength = 63
+
+#
+# table : (natural key columns, surrogate key column)
+#
+deltaKeys = {
+        'mrk_do_cache' : (['_genotype_key', '_term_key', '_marker_key'], '_cache_key'),
+        'mrk_label' : (['_marker_key', 'priority', 'labeltype'], '_label_key'),
+        'mrk_location_cache' : (['_marker_key'], None),
+        'mrk_mcv_cache' : (['_marker_key', '_mcvterm_key'], None),
+        'mrk_mcv_count_cache' : (['_mcvterm_key'], None),
+        'mrk_reference' : (['_marker_key', '_refs_key'], None),
+        }
+
+# set by the load, so not compared
+auditColumns = ['_createdby_key', '_modifiedby_key', 'creation_date', 'modification_date']
+
+def showUsage():
+        '''
+        #
+        # Purpose: Displays the correct usage of this program and exits
+        #
+        '''
+
+        usage = 'usage: %s -T table prepare|swap|rollback|delta\n' % sys.argv[0]
+
+        sys.stderr.write(usage)
+        sys.exit(1)
+
+def exists(table):
+        #
+        # Purpose: checks if a table exists in the schema
+        # Returns: 1 if it exists, else 0
+        #
+
+        results = db.sql('''select 1 from pg_tables
+                where schemaname = '%s' and tablename = '%s'
+                ''' % (schema, table), 'auto')
+
+        return len(results) > 0
+
+def checkStaging(table):
+        #
+        # Purpose: verifies that <table>_new exists and has been loaded
+        # Effects: exits if it has not
+        #
+
+        new = table + NEW
+
+        if not exists(new):
+            print('%s does not exist; run prepare first' % (new))
+            sys.exit(1)
+
+        results = db.sql('select 1 from %s.%s limit 1' % (schema, new), 'auto')
+        if len(results) == 0:
+            print('%s is empty; not applying it to %s' % (new, table))
+            sys.exit(1)
+
+def getColumns(table):
+        #
+        # Purpose: selects the column names of a table
+        # Returns: list of column names, in table order
+        #
+
+        results = db.sql('''select column_name
+                from information_schema.columns
+                where table_schema = '%s' and table_name = '%s'
+                order by ordinal_position
+                ''' % (schema, table), 'auto')
+
+        return [r['column_name'] for r in results]
+
+def getIndexes(table):
+        #
+        # Purpose: selects the indexes of a table that do not back a constraint
+        # Returns: list of (index name, index definition)
+        #
+
+        results = db.sql('''select i.indexname, i.indexdef
+                from pg_indexes i
+                where i.schemaname = '%s'
+                and i.tablename = '%s'
+                and not exists (select 1 from pg_constraint c where c.conname = i.indexname)
+                ''' % (schema, table), 'auto')
+
+        return [(r['indexname'], r['indexdef']) for r in results]
+
+def getConstraints(table):
+        #
+        # Purpose: selects the constraints of a table
+        # Returns: list of (constraint name, constraint definition)
+        #
+
+        results = db.sql('''select conname, pg_get_constraintdef(oid) as condef
+                from pg_constraint
+                where conrelid = '%s.%s'::regclass
+                and contype in ('p', 'u', 'f', 'c')
+                ''' % (schema, table), 'auto')
+
+        return [(r['conname'], r['condef']) for r in results]
+
+def getViews(table):
+        #
+        # Purpose: selects the views that select from a table
+        # Returns: list of (view name, view definition)
+        #
+
+        results = db.sql('''select distinct v.oid::regclass as viewname, pg_get_viewdef(v.oid) as viewdef
+                from pg_depend d, pg_rewrite r, pg_class v
+                where d.refobjid = '%s.%s'::regclass
+                and d.classid = 'pg_rewrite'::regclass
+                and d.objid = r.oid
+                and r.ev_class = v.oid
+                and v.relkind = 'v'
+                and v.oid != d.refobjid
+                ''' % (schema, table), 'auto')
+
+        return [(r['viewname'], r['viewdef']) for r in results]
+
+def suffixed(name, suffix):
+        #
+        # Purpose: the name of an index/constraint of a generation
+        # Returns: name + suffix; if that is longer than postgres keeps,
+        #          name shortened and followed by '_' + 8 characters of its
+        #          md5, so that two long names do not become the same name
+        #
+
+        if suffix == '' or len((name + suffix).encode()) <= maxNameLength:
+            return name + suffix
+
+        digest = hashlib.md5(name.encode()).hexdigest()[:8]
+        keep = maxNameLength - len(suffix) - len(digest) - 1
+
+        return '%s_%s%s' % (name.encode()[:keep].decode('ascii', 'ignore'), digest, suffix)
+
+def getTriggers(table):
+        #
+        # Purpose: selects the (user) triggers of a table
+        # Returns: list of (trigger name, trigger definition)
+        #
+
+        results = db.sql('''select tgname, pg_get_triggerdef(oid) as tgdef
+                from pg_trigger
+                where tgrelid = '%s.%s'::regclass
+                and not tgisinternal
+                ''' % (schema, table), 'auto')
+
+        return [(r['tgname'], r['tgdef']) for r in results]
+
+def copyPrivileges(table, new):
+        #
+        # Purpose: gives <new> the owner and the grants of <table>
+        # Effects: does not commit
+        #
+        # The grants are read from the table's acl, which has every grant
+        # (information_schema lists only those of the current user's roles).
+        #
+
+        results = db.sql('''select pg_get_userbyid(relowner) as owner
+                from pg_class
+                where oid = '%s.%s'::regclass
+                ''' % (schema, table), 'auto')
+        owner = results[0]['owner']
+
+        db.sql('alter table %s.%s owner to "%s"' % (schema, new, owner), None)
+
+        results = db.sql('''select case when a.grantee = 0 then 'PUBLIC'
+                        else pg_get_userbyid(a.grantee) end as grantee,
+                    a.privilege_type, a.is_grantable
+                from pg_class c, aclexplode(c.relacl) a
+                where c.oid = '%s.%s'::regclass
+                ''' % (schema, table), 'auto')
+
+        for r in results:
+            grantee = r['grantee']
+            if grantee == owner:
+                continue
+            if grantee != 'PUBLIC':
+                grantee = '"%s"' % (grantee)
+            cmd = 'grant %s on %s.%s to %s' % (r['privilege_type'], schema, new, grantee)
+            if r['is_grantable']:
+                cmd = cmd + ' with grant option'
+            db.sql(cmd, None)
+
+def renameGeneration(table, fromSuffix, toSuffix, indexes, constraints):
+        #
+        # Purpose: renames one generation of a table along with its
+        #          indexes and constraints
+        # Assumes: 'indexes' and 'constraints' are the live (unsuffixed) names
+        # Effects: renames database objects; does not commit
+        #
+
+        db.sql('alter table %s.%s%s rename to %s%s' \
+                % (schema, table, fromSuffix, table, toSuffix), None)
+
+        for name, condef in constraints:
+            db.sql('alter table %s.%s%s rename constraint %s to %s' \
+                % (schema, table, toSuffix, suffixed(name, fromSuffix), suffixed(name, toSuffix)), None)
+
+        for name, indexdef in indexes:
+            db.sql('alter index %s.%s rename to %s' \
+                % (schema, suffixed(name, fromSuffix), suffixed(name, toSuffix)), None)
+
+def replaceViews(views):
+        #
+        # Purpose: re-creates views so they select from the table that now
+        #          has the live name
+        # Effects: does not commit
+        #
+
+        for name, viewdef in views:
+            db.sql('create or replace view %s as %s' % (name, viewdef), None)
+
+def prepare(table):
+        #
+        # Purpose: creates an empty staging table <table>_new
+        #
+
+        print('creating %s%s...%s' % (table, NEW, mgi_utils.date()))
+
+        db.sql('drop table if exists %s.%s%s' % (schema, table, NEW), None)
+        db.sql('create table %s.%s%s (like %s.%s including defaults)' \
+                % (schema, table, NEW, schema, table), None)
+        db.commit()
+
+def swap(table):
+        #
+        # Purpose: indexes and analyzes <table>_new, then swaps it in
+        # Assumes: <table>_new has been loaded
+        # Effects: the previous <table> is kept as <table>_old
+        #
+
+        new = table + NEW
+
+        checkStaging(table)
+
+        results = db.sql('''select conname from pg_constraint
+                where confrelid = '%s.%s'::regclass
+                ''' % (schema, table), 'auto')
+        if len(results) > 0:
+            print('%s is referenced by a foreign key (%s); cannot swap' % (table, results[0]['conname']))
+            sys.exit(1)
+
+        indexes = getIndexes(table)
+        constraints = getConstraints(table)
+        triggers = getTriggers(table)
+        views = getViews(table)
+
+        print('indexing %s...%s' % (new, mgi_utils.date()))
+
+        for name, indexdef in indexes:
+            indexdef = re.sub(r' INDEX \S+ ON \S+ ', ' INDEX %s ON %s.%s ' % (suffixed(name, NEW), schema, new), indexdef, 1)
+            db.sql(indexdef, None)
+
+        for name, condef in constraints:
+            db.sql('alter table %s.%s add constraint %s %s' % (schema, new, suffixed(name, NEW), condef), None)
+
+        # trigger names belong to their table, so they are not suffixed
+        for name, tgdef in triggers:
+            tgdef = re.sub(r' ON \S+ ', ' ON %s.%s ' % (schema, new), tgdef, 1)
+            db.sql(tgdef, None)
+
+        copyPrivileges(table, new)
+
+        db.commit()
+
+        print('analyzing %s...%s' % (new, mgi_utils.date()))
+        db.sql('analyze %s.%s' % (schema, new), None)
+        db.commit()
+
+        print('swapping %s into %s...%s' % (new, table, mgi_utils.date()))
+
+        if exists(table + OLD):
+            db.sql('drop table %s.%s%s' % (schema, table, OLD), None)
+
+        renameGeneration(table, '', OLD, indexes, constraints)
+        renameGeneration(table, NEW, '', indexes, constraints)
+        replaceViews(views)
+        db.commit()
+
+        print('swapped %s; previous generation is %s%s...%s' % (table, table, OLD, mgi_utils.date()))
+
+def rollback(table):
+        #
+        # Purpose: swaps <table>_old back in as <table>
+        # Effects: the current <table> becomes <table>_old, so a second
+        #          rollback undoes the first
+        #
+
+        if not exists(table + OLD):
+            print('%s%s does not exist; nothing to roll back to' % (table, OLD))
+            sys.exit(1)
+
+        indexes = getIndexes(table)
+        constraints = getConstraints(table)
+        views = getViews(table)
+
+        print('rolling back %s to %s%s...%s' % (table, table, OLD, mgi_utils.date()))
+
+        db.sql('drop table if exists %s.%s%s' % (schema, table, NEW), None)
+        renameGeneration(table, '', NEW, indexes, constraints)
+        renameGeneration(table, OLD, '', indexes, constraints)
+        renameGeneration(table, NEW, OLD, indexes, constraints)
+        replaceViews(views)
+        db.commit()
+
+        # the rows now in the table are not the rows last loaded
+        forgetLoaded(table)
+
+        print('rolled back %s...%s' % (table, mgi_utils.date()))
+
+def forgetLoaded(table):
+        #
+        # Purpose: removes <table>.loaded.md5 and the table's snapshots
+        #          (<table>.*.snapshot; see mrkcacheapply.csh)
+        # Effects: the next load of the table is applied even if its
+        #          rows are the same as the rows last loaded; incremental
+        #          runs that need a snapshot wait for the next full load
+        #
+
+        try:
+            outDir = os.environ['MRKCACHEBCPDIR']
+        except:
+            return
+
+        for f in os.listdir(outDir):
+            name = f.lower()
+            if name == table + '.loaded.md5' \
+                    or (name.startswith(table + '.') and name.endswith('.snapshot')):
+                os.remove(os.path.join(outDir, f))
+
+def delta(table):
+        #
+        # Purpose: applies the differences between <table>_new and <table>
+        # Assumes: <table>_new has been loaded
+        # Effects: deletes/inserts the changed rows of <table> in one
+        #          transaction; drops <table>_new; prints the churn counts
+        #
+
+        new = table + NEW
+
+        if table not in deltaKeys:
+            print('no natural key is defined for %s; cannot apply by delta' % (table))
+            sys.exit(1)
+
+        checkStaging(table)
+
+        keys, surrogate = deltaKeys[table]
+        columns = getColumns(table)
+        compare = [c for c in columns if c != surrogate and c not in auditColumns]
+
+        compareList = str.join(', ', compare)
+        keyMatch = str.join(' and ', ['t.%s = d.%s' % (c, c) for c in keys])
+        rowMatch = 'row(%s) is not distinct from row(%s)' % \
+                (str.join(', ', ['t.' + c for c in compare]), str.join(', ', ['d.' + c for c in compare]))
+
+        print('comparing %s with %s...%s' % (new, table, mgi_utils.date()))
+
+        db.sql('analyze %s.%s' % (schema, new), None)
+
+        db.sql('''select %s into temporary table delta_deletes
+                from %s.%s except select %s from %s.%s
+                ''' % (compareList, schema, table, compareList, schema, new), None)
+
+        db.sql('''select %s into temporary table delta_inserts
+                from %s.%s except select %s from %s.%s
+                ''' % (compareList, schema, new, compareList, schema, table), None)
+
+        results = db.sql('select count(*) as total from %s.%s' % (schema, table), 'auto')
+        before = results[0]['total']
+
+        db.sql('''delete from %s.%s t using delta_deletes d where %s and %s
+                ''' % (schema, table, keyMatch, rowMatch), None)
+        results = db.sql('select count(*) as total from %s.%s' % (schema, table), 'auto')
+        deleted = before - results[0]['total']
+
+        if surrogate is None:
+            select = str.join(', ', ['t.' + c for c in columns])
+        else:
+            results = db.sql('select coalesce(max(%s), 0) as maxKey from %s.%s' \
+                % (surrogate, schema, table), 'auto')
+            maxKey = results[0]['maxKey']
+            select = str.join(', ', ['t.' + c for c in columns]).replace(
+                't.%s' % (surrogate), '%s + row_number() over () as %s' % (maxKey, surrogate), 1)
+
+        db.sql('''insert into %s.%s (%s) select %s from %s.%s t, delta_inserts d where %s and %s
+                ''' % (schema, table, str.join(', ', columns), select, schema, new, keyMatch, rowMatch), None)
+        results = db.sql('select count(*) as total from %s.%s' % (schema, table), 'auto')
+        inserted = results[0]['total'] - (before - deleted)
+
+        db.sql('drop table %s.%s' % (schema, new), None)
+        db.commit()
+
+        db.sql('analyze %s.%s' % (schema, table), None)
+        db.commit()
+
+        print('%s: %d rows unchanged, %d deleted, %d inserted...%s' \
+                % (table, before - deleted, deleted, inserted, mgi_utils.date()))
+
+#
+# Main Routine
+#
+
+if __name__ == '__main__':
+
+        print('%s' % mgi_utils.date())
+
+        try:
+                optlist, args = getopt.getopt(sys.argv[1:], 'T:')
+        except:
+                showUsage()
+
+        table = None
+
+        for opt in optlist:
+                if opt[0] == '-T':
+                        table = opt[1].lower()
+                else:
+                        showUsage()
+
+        if table is None or len(args) != 1:
+                showUsage()
+
+        # need to create/rename tables, so we need a user with ddl permission
+        user = os.environ['MGD_DBUSER']
+        passwordFile = os.environ['MGD_DBPASSWORDFILE']
+        password = str.strip(open(passwordFile, 'r').readline())
+        db.set_sqlUser(user)
+        db.set_sqlPassword(password)
+
+        db.useOneConnection(1)
+
+        if args[0] == 'prepare':
+                prepare(table)
+        elif args[0] == 'swap':
+                swap(table)
+        elif args[0] == 'rollback':
+                rollback(table)
+        elif args[0] == 'delta':
+                delta(table)
+        else:
+                showUsage()
+
+        db.useOneConnection(0)
+
+        print('%s' % mgi_utils.date())
@@ -0,0 +1,534 @@
+'''
+#
+# Purpose:
+#
+# Routines shared by the marker cache loads
+#
+# streamSql() : runs a query through a server-side cursor and returns
+#	the rows one at a time, fetching MRKCACHEFETCHSIZE rows at a time,
+#	so that a load never holds the full result set in memory
+#
+# streamConnection() : the same, on a second connection (connect())
+#
+# openOutput() : returns the writer a load uses for its cache rows;
+#	MRKCACHELOADMODE selects how the rows reach the database:
+#
+#	bcp  : BCPWriter writes ${MRKCACHEBCPDIR}/<table>.bcp, which the
+#	       wrapper then loads with ${BCP_CMD}
+#
+#	copy : CopyWriter streams the rows into 'copy from stdin' on a second
+#	       connection, into a temp table; when the load completes, the
+#	       table is truncated and reloaded from it in one short
+#	       transaction and no bcp file is written
+#
+#	When MRKCACHEAPPLY is not 'reload', the rows are copied into the
+#	staging table <table>_new instead (see mrkcacheapply.py).
+#
+# InsertWriter : inserts the rows of a load's incremental (by-key) mode
+#	on the load's own connection, inside the load's transaction
+#
+#	Both writers keep an md5 digest of the rows, less the load date, and
+#	write it to ${MRKCACHEBCPDIR}/<table>.md5 when the load completes.
+#	mrkcacheapply.csh compares it with <table>.loaded.md5, the digest of
+#	the rows last loaded, and skips the load when they are the same.
+#
+# normalizeLabel() : the normalized form of an MRK_Label label
+#	(MRK_Label.normalizedLabel); a lookup against that column
+#	normalizes its value with it, e.g.
+#
+#		import mrkcachelib
+#		value = mrkcachelib.normalizeLabel('Pax-6')
+#
+# History
+#
+'''
+
+import os
+import re
+import hashlib
+import threading
+import psycopg2
+import mgi_utils
+import db
+
+# number of rows fetched from a server-side cursor at one time
+try:
+    fetchSize = int(os.environ['MRKCACHEFETCHSIZE'])
+except:
+    fetchSize = 10000
+
+# used to give each server-side cursor a unique name
+cursorCount = 0
+
+try:
+    loadMode = os.environ['MRKCACHELOADMODE']
+except:
+    loadMode = 'bcp'
+
+try:
+    applyMode = os.environ['MRKCACHEAPPLY']
+except:
+    applyMode = 'reload'
+
+try:
+    schema = os.environ['PG_DB_SCHEMA']
+except:
+    schema = 'mgd'
+
+try:
+    COLDL = os.environ['COLDELIM']
+except:
+    COLDL = '|'
+
+# the loads' line delimiter
+LINEDL = '\n'
+
+# BCPWriter's buffer size, in bytes
+try:
+    bufferSize = int(os.environ['MRKCACHEBUFFERSIZE'])
+except:
+    bufferSize = 1048576
+
+# 1 : BCPWriter fsyncs the bcp file when it is complete
+try:
+    fsync = os.environ['MRKCACHEFSYNC'] == '1'
+except:
+    fsync = 0
+
+# 1 : BCPWriter writes <table>.bcp.tmp and renames it when it is complete
+try:
+    renameOnComplete = os.environ['MRKCACHERENAME'] == '1'
+except:
+    renameOnComplete = 0
+
+# the creation/modification date every load writes into its rows;
+# removed from the digest so that only a change in the rows counts
+loadDate = mgi_utils.date('%m/%d/%Y')
+
+# the characters normalizeLabel() removes
+punctuation = re.compile(r'[^\w\s]|_')
+
+class Row(dict):
+        #
+        # Purpose: a result row whose column names are case-insensitive
+        #
+        # The server returns unquoted column names in lower case, so rows
+        # fetched from a cursor would otherwise not match the mixed-case
+        # names ('_Marker_key') the loads use.
+        #
+
+        def __init__(self, r):
+            dict.__init__(self)
+            for key in r:
+                self[key] = r[key]
+
+        def __getitem__(self, key):
+            return dict.__getitem__(self, key.lower())
+
+        def __setitem__(self, key, value):
+            dict.__setitem__(self, key.lower(), value)
+
+        def __contains__(self, key):
+            return dict.__contains__(self, key.lower())
+
+        def get(self, key, default = None):
+            return dict.get(self, key.lower(), default)
+
+def streamSql(cmd, batchSize = None):
+        #
+        # Purpose: runs a query through a server-side cursor
+        # Returns: generator of Row, one per result row
+        # Assumes: the load uses one connection (db.useOneConnection(1)),
+        #          so the cursor can see the load's temp tables
+        # Effects: declares/closes a cursor on the shared connection
+        # Throws:
+        #
+        # The cursor is declared 'with hold' so that it survives a
+        # db.commit() issued while the rows are still being read.
+        #
+
+        global cursorCount
+
+        if batchSize is None:
+            batchSize = fetchSize
+
+        cursorCount = cursorCount + 1
+        cursorName = 'mrkcache_cursor%d' % (cursorCount)
+
+        db.sql('declare %s no scroll cursor with hold for %s' % (cursorName, cmd), None)
+
+        try:
+            while 1:
+                results = db.sql('fetch forward %d from %s' % (batchSize, cursorName), 'auto')
+
+                for r in results:
+                    yield Row(r)
+
+                if len(results) < batchSize:
+                    break
+        finally:
+            db.sql('close %s' % (cursorName), None)
+
+def streamConnection(conn, cmd, batchSize = None):
+        #
+        # Purpose: runs a query through a server-side cursor on a
+        #          connection of its own (see connect())
+        # Returns: generator of Row, one per result row
+        # Assumes: conn is not in autocommit mode
+        # Effects: opens/closes a named cursor on conn
+        # Throws:
+        #
+        # Used where a load runs queries on several connections at once,
+        # which the db module's single connection cannot do.
+        #
+
+        global cursorCount
+
+        if batchSize is None:
+            batchSize = fetchSize
+
+        cursorCount = cursorCount + 1
+        cursor = conn.cursor(name = 'mrkcache_cursor%d' % (cursorCount))
+        cursor.itersize = batchSize
+
+        try:
+            cursor.execute(cmd)
+            names = None
+
+            while 1:
+                results = cursor.fetchmany(batchSize)
+
+                if names is None:
+                    names = [d[0] for d in cursor.description]
+
+                for r in results:
+                    yield Row(dict(zip(names, r)))
+
+                if len(results) < batchSize:
+                    break
+        finally:
+            cursor.close()
+
+def connect():
+        #
+        # Purpose: opens a second connection to the load's database
+        # Returns: psycopg2 connection
+        # Assumes: the db module's login has been set
+        # Effects:
+        # Throws:
+        #
+
+        return psycopg2.connect(host=db.get_sqlServer(),
+                dbname=db.get_sqlDatabase(),
+                user=db.get_sqlUser(),
+                password=db.get_sqlPassword())
+
+class Digest:
+        #
+        # Purpose: the md5 digest of the rows a load writes
+        #
+        # <outDir>/<table>.md5 is removed when the load starts and only
+        # written when it completes, so a load that fails never leaves
+        # a digest behind for its partial output.
+        #
+
+        def __init__(self, table, outDir):
+            self.md5 = hashlib.md5()
+            self.path = '%s/%s.md5' % (outDir, table)
+            self.loadedPath = '%s/%s.loaded.md5' % (outDir, table)
+
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+        def update(self, s):
+            self.md5.update(s.replace(loadDate, '').encode())
+
+        def unchanged(self):
+            # the rows are the same as the rows last loaded
+            try:
+                fp = open(self.loadedPath, 'r')
+                loaded = fp.read().strip()
+                fp.close()
+            except:
+                return 0
+
+            return loaded == self.md5.hexdigest()
+
+        def save(self):
+            fp = open(self.path, 'w')
+            fp.write(self.md5.hexdigest() + '\n')
+            fp.close()
+
+class BCPWriter:
+        #
+        # Purpose: writes cache rows to <outDir>/<table>.bcp
+        #
+        # The file is written through a MRKCACHEBUFFERSIZE byte buffer, so
+        # rows reach the file in large writes; a load should not flush()
+        # per row.  With MRKCACHEFSYNC=1, close() fsyncs the file.  With
+        # MRKCACHERENAME=1, the rows are written to <table>.bcp.tmp, which
+        # close() renames to <table>.bcp, so <table>.bcp is never a
+        # partial file.
+        #
+
+        def __init__(self, table, outDir):
+            self.path = '%s/%s.bcp' % (outDir, table)
+            self.digest = Digest(table, outDir)
+
+            if renameOnComplete:
+                self.writePath = self.path + '.tmp'
+            else:
+                self.writePath = self.path
+
+            self.fp = open(self.writePath, 'w', buffering = bufferSize)
+
+        def write(self, s):
+            self.digest.update(s)
+            self.fp.write(s)
+
+        def flush(self):
+            self.fp.flush()
+
+        def close(self):
+            if fsync:
+                self.fp.flush()
+                os.fsync(self.fp.fileno())
+
+            self.fp.close()
+
+            if renameOnComplete:
+                os.rename(self.writePath, self.path)
+
+            self.digest.save()
+
+        def abort(self):
+            self.fp.close()
+
+            if renameOnComplete:
+                os.remove(self.writePath)
+
+class CopyWriter:
+        #
+        # Purpose: streams cache rows into 'copy ... from stdin'
+        #
+        # The rows are written to a pipe that a second thread feeds to
+        # copy_expert() on a second connection.
+        #
+        # The rows are copied into a temp table of the second connection
+        # (like <table>), which takes no lock on <table> while the load
+        # runs.  close() then replaces the contents of <table> in one
+        # short transaction: the truncate, the dropping of the table's
+        # indexes, the insert from the temp table and the re-creation of
+        # the indexes.  abort() (or the load exiting early) leaves the
+        # previous contents of the table in place, as does close() when
+        # the rows are the same as the rows last loaded.
+        #
+        # staging : copy into <table>_new (created by mrkcacheapply.py)
+        #           instead, dropping its indexes for the copy; close()
+        #           re-creates them and commits
+        #
+
+        def __init__(self, table, outDir, staging = 0):
+            if staging:
+                target = table + '_new'
+            else:
+                target = table
+
+            self.target = target
+            self.table = '%s.%s' % (schema, target)
+            self.staging = staging
+            self.digest = Digest(table, outDir)
+            self.conn = connect()
+            self.cursor = self.conn.cursor()
+            self.error = None
+
+            if staging:
+                copyTable = self.table
+                self.indexes = self.dropIndexes()
+            else:
+                copyTable = 'mrkcache_copy_%s' % (target)
+                self.cursor.execute('create temporary table %s (like %s)' % (copyTable, self.table))
+                self.conn.commit()
+
+            self.copyTable = copyTable
+
+            readFd, writeFd = os.pipe()
+            self.reader = os.fdopen(readFd, 'r')
+            self.fp = os.fdopen(writeFd, 'w')
+
+            cmd = "copy %s from stdin with null as '' delimiter as '%s'" % (copyTable, COLDL)
+            self.thread = threading.Thread(target=self.copy, args=(cmd,), daemon=True)
+            self.thread.start()
+
+        def dropIndexes(self):
+            #
+            # Purpose: drops the indexes of the target that do not back
+            #          a constraint
+            # Returns: list of (index name, index definition), to re-create
+            #
+
+            self.cursor.execute('''select i.indexname, i.indexdef
+                from pg_indexes i
+                where i.schemaname = %s
+                and i.tablename = %s
+                and not exists (select 1 from pg_constraint c where c.conname = i.indexname)
+                ''', (schema, self.target.lower()))
+            indexes = self.cursor.fetchall()
+
+            for name, indexdef in indexes:
+                self.cursor.execute('drop index %s.%s' % (schema, name))
+
+            return indexes
+
+        def copy(self, cmd):
+            try:
+                self.cursor.copy_expert(cmd, self.reader)
+            except Exception as e:
+                self.error = e
+            self.reader.close()
+
+        def write(self, s):
+            self.digest.update(s)
+            try:
+                self.fp.write(s)
+            except BrokenPipeError:
+                # the copy has stopped reading; report why
+                self.thread.join()
+                raise self.error
+
+        def flush(self):
+            self.fp.flush()
+
+        def close(self):
+            try:
+                self.fp.close()
+            except BrokenPipeError:
+                pass
+
+            self.thread.join()
+
+            if self.error is not None:
+                self.conn.rollback()
+                self.conn.close()
+                raise self.error
+
+            if self.digest.unchanged():
+                print('%s is unchanged since it was last loaded' % (self.table))
+                self.conn.rollback()
+                self.conn.close()
+                self.digest.save()
+                return
+
+            if not self.staging:
+                # the copy is complete: replace the table's rows
+                self.conn.commit()
+                self.cursor.execute('truncate table %s' % (self.table))
+                self.indexes = self.dropIndexes()
+                self.cursor.execute('insert into %s select * from %s' % (self.table, self.copyTable))
+
+            for name, indexdef in self.indexes:
+                self.cursor.execute(indexdef)
+
+            self.conn.commit()
+            self.conn.close()
+            self.digest.save()
+
+        def abort(self):
+            try:
+                self.fp.close()
+            except BrokenPipeError:
+                pass
+
+            self.thread.join()
+            self.conn.rollback()
+            self.conn.close()
+
+class InsertWriter:
+        #
+        # Purpose: inserts cache rows into <table> on the load's connection
+        #
+        # Used by the loads' incremental (by-key) modes.  The rows are
+        # written in bcp format, as to the other writers, and inserted in
+        # batches of MRKCACHEFETCHSIZE rows.  Nothing is committed: the
+        # load deletes the rows being replaced, writes the new ones and
+        # commits both together.  An empty field is inserted as null.
+        #
+        # conn : insert on this connection (see connect()) instead
+        #
+
+        def __init__(self, table, batchSize = None, conn = None):
+            self.table = table
+            self.batchSize = batchSize or fetchSize
+            self.conn = conn
+            self.rows = []
+            self.count = 0
+
+        def write(self, s):
+            # split on LINEDL only: str.splitlines() would also split a
+            # label or citation that contains \r, \x0c, \x1c-\x1e, \x85
+            # or \u2028
+            lines = s.split(LINEDL)
+            if lines[-1] == '':
+                lines.pop()
+
+            for line in lines:
+                values = []
+                for v in line.split(COLDL):
+                    if v == '':
+                        values.append('null')
+                    else:
+                        values.append("'%s'" % (v.replace("'", "''")))
+                self.rows.append('(%s)' % (','.join(values)))
+
+            if len(self.rows) >= self.batchSize:
+                self.flush()
+
+        def flush(self):
+            if self.rows:
+                cmd = 'insert into %s values %s' % (self.table, ',\n'.join(self.rows))
+                if self.conn is None:
+                    db.sql(cmd, None)
+                else:
+                    self.conn.cursor().execute(cmd)
+                self.count = self.count + len(self.rows)
+                self.rows = []
+
+        def close(self):
+            self.flush()
+
+        def abort(self):
+            self.rows = []
+
+def openOutput(table, outDir):
+        #
+        # Purpose: opens the output for a load's cache rows
+        # Returns: CopyWriter if MRKCACHELOADMODE is 'copy', else BCPWriter
+        # Assumes:
+        # Effects: see BCPWriter, CopyWriter
+        # Throws:
+        #
+        # Either writer is used like a file:  write(), close() when the
+        # load succeeds, or abort() when it fails.
+        #
+
+        if loadMode == 'copy' and applyMode != 'reload':
+            print('Loading %s_new by copy...' % (table))
+            return CopyWriter(table, outDir, staging = 1)
+
+        if loadMode == 'copy':
+            print('Loading %s by copy...' % (table))
+            return CopyWriter(table, outDir)
+
+        return BCPWriter(table, outDir)
+
+def normalizeLabel(label):
+        #
+        # Purpose: normalizes a label for equality lookups
+        # Returns: label in lower case, punctuation removed, white space
+        #          collapsed
+        #
+        # '|' (which mrklabel.py writes as '#') is punctuation, so a label
+        # normalizes the same before and after that substitution.
+        #
+
+        return str.join(' ', str.split(punctuation.sub('', label.lower())))
@@ -0,0 +1,210 @@
+'''
+#
+# Purpose:
+#
+# Run all of the marker cache loads, in dependency order,
+# running independent loads concurrently.
+#
+# Uses environment variables to determine the log directory and
+# the default number of workers (MRKCACHEWORKERS)
+#
+# Usage:
+#	mrkcacheload.py [-w workers] [load ...]
+#
+# If one or more load names are provided, then only those loads
+# (and not their dependencies) are run.
+#
+# Processing:
+#
+#	1. Start every load whose dependencies have completed, up to
+#	   the number of workers.
+#	2. As each load finishes, record its exit status and wall time.
+#	   Any load that depends on a failed load is skipped.  A wrapper
+#	   exits 1 when its python, bcp or apply step fails.
+#	3. Print a summary of each load's status and timing.
+#
+# Dependencies:
+#
+#	mrkref.csh reads PRB_Marker, so it must follow mrkprobe.csh.
+#
+#	mrkmcvcount.py reads MRK_MCV_Cache, so it must follow the
+#	MRK_MCV_Cache load; mrkmcv.csh already runs it after that load.
+#
+# History
+#
+'''
+
+import sys
+import os
+import getopt
+import time
+import subprocess
+import concurrent.futures
+import mgi_utils
+
+#
+# load name : (wrapper, list of loads that must complete first)
+#
+loads = {
+        'mrkdo' : ('mrkdo.csh', []),
+        'mrklabel' : ('mrklabel.csh', []),
+        'mrklocation' : ('mrklocation.csh', []),
+        'mrkmcv' : ('mrkmcv.csh', []),
+        'mrkprobe' : ('mrkprobe.csh', []),
+        'mrkref' : ('mrkref.csh', ['mrkprobe']),
+        }
+
+# exit status of a load that was not run because a dependency failed
+SKIPPED = -1
+
+try:
+    workers = int(os.environ['MRKCACHEWORKERS'])
+except:
+    workers = 3
+
+def showUsage():
+        '''
+        #
+        # Purpose: Displays the correct usage of this program and exits
+        #
+        '''
+
+        usage = 'usage: %s [-w workers] [load ...]\n' % sys.argv[0] + \
+                'loads: %s\n' % (str.join(' ', loads.keys()))
+
+        sys.stderr.write(usage)
+        sys.exit(1)
+
+def runLoad(name):
+        #
+        # Purpose: runs the wrapper for one load
+        # Returns: exit status, wall time (seconds)
+        # Assumes: current directory is the product directory
+        # Effects: runs the wrapper; the wrapper writes its own log
+        # Throws:
+        #
+
+        wrapper = loads[name][0]
+        print('starting %s...%s' % (wrapper, mgi_utils.date()))
+        sys.stdout.flush()
+
+        start = time.time()
+        status = subprocess.call(['./' + wrapper], stdout=subprocess.DEVNULL)
+        elapsed = time.time() - start
+
+        print('finished %s (status %d)...%s' % (wrapper, status, mgi_utils.date()))
+        sys.stdout.flush()
+
+        return status, elapsed
+
+def runAll(toRun, workers):
+        #
+        # Purpose: runs the loads in dependency order
+        # Returns: dictionary of load name : (exit status, wall time)
+        # Assumes:
+        # Effects: runs up to 'workers' loads at one time
+        # Throws:
+        #
+
+        results = {}
+        pending = list(toRun)
+        running = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+
+            while pending or running:
+
+                for name in list(pending):
+                    deps = [d for d in loads[name][1] if d in toRun]
+
+                    # skip the load if any of its dependencies did not succeed
+                    if [d for d in deps if d in results and results[d][0] != 0]:
+                        print('skipping %s; a dependency failed' % (loads[name][0]))
+                        results[name] = (SKIPPED, 0)
+                        pending.remove(name)
+
+                    elif not [d for d in deps if d not in results]:
+                        running[executor.submit(runLoad, name)] = name
+                        pending.remove(name)
+
+                if not running:
+                    continue
+
+                done, notDone = concurrent.futures.wait(running,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for f in done:
+                    results[running.pop(f)] = f.result()
+
+        return results
+
+def printSummary(toRun, results, elapsed):
+        #
+        # Purpose: prints the exit status and wall time of each load
+        # Returns:
+        # Assumes:
+        # Effects: writes to stdout
+        # Throws:
+        #
+
+        print('\n%-15s %-10s %10s' % ('load', 'status', 'seconds'))
+        print(37 * '-')
+
+        serial = 0
+        for name in toRun:
+            status, seconds = results[name]
+            serial = serial + seconds
+
+            if status == SKIPPED:
+                s = 'skipped'
+            elif status == 0:
+                s = 'ok'
+            else:
+                s = 'failed(%d)' % (status)
+
+            print('%-15s %-10s %10.1f' % (name, s, seconds))
+
+        print(37 * '-')
+        print('%-26s %10.1f' % ('total (serial)', serial))
+        print('%-26s %10.1f' % ('total (wall)', elapsed))
+
+#
+# Main Routine
+#
+
+if __name__ == '__main__':
+
+        print('%s' % mgi_utils.date())
+
+        try:
+                optlist, args = getopt.getopt(sys.argv[1:], 'w:')
+        except:
+                showUsage()
+
+        for opt in optlist:
+                if opt[0] == '-w':
+                        workers = int(opt[1])
+                else:
+                        showUsage()
+
+        for name in args:
+                if name not in loads:
+                        showUsage()
+
+        if len(args) > 0:
+                toRun = args
+        else:
+                toRun = list(loads.keys())
+
+        os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+
+        start = time.time()
+        results = runAll(toRun, max(workers, 1))
+        printSummary(toRun, results, time.time() - start)
+
+        print('%s' % mgi_utils.date())
+
+        if [name for name in toRun if results[name][0] != 0]:
+                sys.exit(1)
+
+        sys.exit(0)
@@ -10,6 +10,18 @@
 #
 # Usage:
 #	mrkdo.py -Sdbserver -Ddatabase -Uuser -Ppasswordfile
+#	mrkdo.py -Sdbserver -Ddatabase -Uuser -Ppasswordfile -Kgenotypekey
+#	mrkdo.py -Sdbserver -Ddatabase -Uuser -Ppasswordfile -Mmarkerkey
+#
+#	mrkdo.py -Sdbserver -Ddatabase -Uuser -Ppasswordfile -Ttermid[,termid...]
+#	mrkdo.py -Sdbserver -Ddatabase -Uuser -Ppasswordfile -H
+#
+#	-K : refresh only the rows of one genotype
+#	-M : refresh only the rows of the genotypes of one marker
+#	-T : refresh only the rows of the given DO term IDs
+#	-H : refresh only the rows of the DO terms whose human annotations
+#	     changed since the last full or -H run (a full load's human
+#	     annotations count once mrkcacheapply.csh has applied its rows)
 #
 # Processing:
 #
@@ -56,6 +68,8 @@ import getopt
 import re
 import mgi_utils
 import db
+import mrkcachelib
+import mrkortholog
 
 
 try:
@@ -63,11 +77,36 @@ try:
     LINEDL = '\n'
     table = os.environ['TABLE']
     outDir = os.environ['MRKCACHEBCPDIR']
+    # the human DO annotations as of the last full or -H run (see processByTerm())
+    humanSnapshot = '%s/%s.human.snapshot' % (outDir, table)
 except:
+    # run from EI without the load's environment
+    COLDL = mrkcachelib.COLDL
+    LINEDL = '\n'
     table = 'MRK_DO_Cache'
 
 doBCP = None
 
+# the mouse annotation records of domouse1 (see selectAnnotations()), with
+# their marker and allele symbols, DO term and ID and J number, ordered
+# by genotype (see processMouse())
+mouseQuery = '''select o.*, m._Organism_key, m.symbol as markerSymbol, m._Marker_Type_key,
+            al.symbol as alleleSymbol, t.term, ta.accID as termID, ja.accID as jnumID
+        from domouse1 o, MRK_Marker m, ALL_Allele al, VOC_Term t, ACC_Accession ta, ACC_Accession ja
+        where o._Marker_key = m._Marker_key
+        and o._Allele_key = al._Allele_key
+        and o._Term_key = t._Term_key
+        and o._Term_key = ta._Object_key
+        and ta._MGIType_key = 13
+        and ta.preferred = 1
+        and o._Refs_key = ja._Object_key
+        and ja._MGIType_key = 1
+        and ja._LogicalDB_key = 1
+        and ja.prefixPart = 'J:'
+        and ja.preferred = 1
+        order by o._Genotype_key, alleleSymbol, t.term
+        '''
+
 cdate = mgi_utils.date("%m/%d/%Y")
 
 mouseDOannotationKey = 1020
@@ -76,13 +115,13 @@ mouseOrganismKey = 1
 humanOrganismKey = 2
 
 humanOrtholog = {}	# mouse marker key : human ortholog (key, symbol)
-mouseOrtholog = {}	# human marker key : mouse ortholog (key, symbol)
+mouseOrtholog = {}	# human marker key : mouse ortholog key
+orthologGraph = None	# Alliance clustered homology (mrkortholog)
 genotypeOrtholog = {}   # genotype key : list of human marker keys:symbols
 
-humanToDO = {}	# human marker key : DO term id
-DOToHuman = {}	# DO term id : list of human marker keys
-
-genotypeAlleleMouseModels = {}	# mouse genotype key + termID: display category 3
+humanToDO = {}	# human marker key : set of DO term ids
+DOToHuman = {}	# DO term id : set of human marker keys
+DOAllOrthologs = {}	# DO term id : 1 if every human marker annotated to it has a mouse ortholog
 
 notQualifier = []
 
@@ -126,7 +165,11 @@ def showUsage():
                 '-S server\n' + \
                 '-D database\n' + \
                 '-U user\n' + \
-                '-P password file\n'
+                '-P password file\n' + \
+                '-K genotype key (optional)\n' + \
+                '-M marker key (optional)\n' + \
+                '-T DO term ID[,DO term ID...] (optional)\n' + \
+                '-H changed human annotations only (optional)\n'
 
         sys.stderr.write(usage)
         sys.exit(1)
@@ -279,14 +322,7 @@ def deriveAlleleDetailMouseModels(r):
 
                 # check each human gene annotated to Term
 
-                orthologFound = 1
-
-                for g in DOToHuman[termID]:
-                    # if human gene has no mouse ortholog, flag it
-                    if g not in mouseOrtholog:
-                        orthologFound = 0
-
-                if orthologFound:
+                if DOAllOrthologs[termID]:
                     headerFootnote = headerFootnote2b % (symbol)
                     return 2, phenoHeader2b, headerFootnote, genotypeFootnote
                 else:
@@ -305,148 +341,83 @@ def selectMouse():
         # Returns:
         # Assumes:  temp table domouse1 has already been created
         # Effects:  initializes global dictionaries/caches
-        #	- humanOrtholog, genotypeOrtholog
+        #	- humanOrtholog, genotypeOrtholog, orthologGraph
         # Throws:
         #
 
-        global humanOrtholog, genotypeOrtholog
+        global humanOrtholog, genotypeOrtholog, orthologGraph
 
         db.sql('create index idx1 on domouse1(_Marker_key)', None)
-        db.sql('create index idx2 on domouse1(_Allele_key)', None)
-
-        #
-        # resolve marker symbol
-        #
-        db.sql('''select o.*, m._Organism_key, m.symbol as markerSymbol, m._Marker_Type_key, a.symbol as alleleSymbol 
-                INTO TEMPORARY TABLE domouse2 
-                from domouse1 o, MRK_Marker m, ALL_Allele a 
-                where o._Marker_key = m._Marker_key 
-                and o._Allele_key = a._Allele_key
-                ''', None)
-        db.sql('create index idx3 on domouse2(_Marker_key)', None)
-
-        #
-        # resolve DO term and ID
-        #
-        db.sql('''select o.*, t.term, a.accID as termID 
-                INTO TEMPORARY TABLE domouse3 
-                from domouse2 o, VOC_Term t, ACC_Accession a 
-                where o._Term_key = t._Term_key 
-                and o._Term_key = a._Object_key 
-                and a._MGIType_key = 13 
-                and a.preferred = 1
-                ''', None)
-        db.sql('create index idx4 on domouse3(_Refs_key)', None)
-
-        #
-        # resolve Jnumber
-        #
-        db.sql('''select o.*, a.accID as jnumID 
-                INTO TEMPORARY TABLE domouse4 
-                from domouse3 o, ACC_Accession a 
-                where o._Refs_key = a._Object_key 
-                and a._MGIType_key = 1 
-                and a._LogicalDB_key = 1 
-                and a.prefixPart = 'J:' 
-                and a.preferred = 1
-                ''', None)
-        db.sql('create index idx5 on domouse4(_Genotype_key)', None)
-        db.sql('create index idx6 on domouse4(_Allele_key)', None)
 
         #
         # resolve human ortholog
         #
-        db.sql('''select distinct o._Marker_key, cm2._Marker_key as orthologKey,  
-                    m2.symbol as orthologSymbol
-                INTO TEMPORARY TABLE orthologHuman
-                from domouse1 o, MRK_Cluster c1, MRK_ClusterMember cm1, MRK_Cluster c2, 
-                    MRK_ClusterMember cm2, MRK_Marker m2 
-                where o._Marker_key = cm1._Marker_key
-                and cm1._Cluster_key = c1._Cluster_key
-                and c1._ClusterType_key = 9272150
-                and c1._ClusterSource_key = 75885740
-                and c1._Cluster_key = c2._Cluster_key
-                and c2._Cluster_key = cm2._Cluster_key
-                and cm2._Marker_key = m2._Marker_key 
-                and m2._Organism_key = %s''' % (humanOrganismKey), None)
-        db.sql('create index idx7 on orthologHuman(_Marker_key)', None)
-
-        results = db.sql('select * from orthologHuman', 'auto')
-        for r in results:
-            key = r['_Marker_key']
-            value = r
-            humanOrtholog[key] = value
+        orthologGraph = mrkortholog.clusteredGraph()
 
-        #
-        # resolve genotype-to-orthologs
-        #
-        results = db.sql('''select distinct g._Genotype_key, o.orthologKey, o.orthologSymbol 
-                from domouse1 g, orthologHuman o 
-                where g._Marker_key = o._Marker_key
-                ''', 'auto')
+        humanSymbol = {}
+        results = mrkcachelib.streamSql('select _Marker_key, symbol from MRK_Marker where _Organism_key = %s' \
+                % (humanOrganismKey))
         for r in results:
-            key = r['_Genotype_key']
-            value = r
-            if key not in genotypeOrtholog:
-                genotypeOrtholog[key] = []
-            genotypeOrtholog[key].append(value)
+            humanSymbol[r['_Marker_key']] = r['symbol']
 
-def cacheGenotypeDisplay3():
         #
-        # Purpose:  initializes global dictionary of genotype/terms and minimum display category 1 values
-        # Returns:
-        # Assumes:  temp table domouse4 exists
-        # Effects:  initializes global genotypeAlleleMouseModels dictionary
-        # Throws:
-        #
-
-        global genotypeAlleleMouseModels
-
-        #
-        # for each genotype/term, cache the mininum display category 1 value
-        # this will be display category 3 (human disease table 2 (Mouse Models))
+        # resolve genotype-to-orthologs
         #
+        genotypeOrthologKeys = {}
 
-        results = db.sql('select * from domouse4 order by _Genotype_key, termID', 'auto')
-
+        results = mrkcachelib.streamSql('select distinct _Genotype_key, _Marker_key from domouse1')
         for r in results:
+            marker = r['_Marker_key']
+            orthologs = [key for key, organism in orthologGraph.membersOf(marker, (humanOrganismKey,))]
+            if len(orthologs) == 0:
+                continue
 
-            genotype = r['_Genotype_key']
-            termID = r['termID']
-            gcKey = repr(genotype) + termID
-            alleleDetailMouseModels, header, headerFootnote, genotypeFootnote = deriveAlleleDetailMouseModels(r)
+            if marker not in humanOrtholog:
+                humanOrtholog[marker] = {'orthologKey' : orthologs[-1],
+                        'orthologSymbol' : humanSymbol[orthologs[-1]]}
 
-            if gcKey in genotypeAlleleMouseModels:
-                if alleleDetailMouseModels < genotypeAlleleMouseModels[gcKey]:
-                    genotypeAlleleMouseModels[gcKey] = alleleDetailMouseModels
-            else:
-                genotypeAlleleMouseModels[gcKey] = alleleDetailMouseModels
+            key = r['_Genotype_key']
+            if key not in genotypeOrthologKeys:
+                genotypeOrthologKeys[key] = set()
+            genotypeOrthologKeys[key].update(orthologs)
 
-def processMouse():
+        for key in genotypeOrthologKeys:
+            genotypeOrtholog[key] = []
+            for orthologKey in sorted(genotypeOrthologKeys[key]):
+                genotypeOrtholog[key].append({'orthologKey' : orthologKey,
+                        'orthologSymbol' : humanSymbol[orthologKey]})
+
+def processGenotype(rows):
         #
-        # Purpose:  process Mouse records either by bcp
+        # Purpose:  classifies and writes the records of one genotype
         # Returns:
-        # Assumes:
-        # Effects:
+        # Assumes:  rows are all of the mouse records of one genotype,
+        #           in output order
+        # Effects:  writes the records to doBCP
         # Throws:
         #
+        # Each record is classified once; the classification gives both
+        # the record's own category and, per genotype/term, the minimum
+        # display category 1 value, which is display category 3
+        # (human disease table 2 (Mouse Models)).
+        #
 
         global nextMaxKey
 
-        #
-        # process each individual marker/genotype record
-        #
+        derived = []
+        genotypeAlleleMouseModels = {}	# termID : display category 3
 
-        results = db.sql('select * from domouse4 order by _Genotype_key, alleleSymbol, term', 'auto')
+        for r in rows:
+            termID = r['termID']
+            d = deriveAlleleDetailMouseModels(r)
+            derived.append(d)
 
-        for r in results:
+            if termID not in genotypeAlleleMouseModels or d[0] < genotypeAlleleMouseModels[termID]:
+                genotypeAlleleMouseModels[termID] = d[0]
 
-            marker = r['_Marker_key']
-            genotype = r['_Genotype_key']
-            termID = r['termID']
-            gcKey = repr(genotype) + termID
+        for r, d in zip(rows, derived):
 
-            alleleDetailMouseModels, header, headerFootnote, genotypeFootnote = deriveAlleleDetailMouseModels(r)
+            alleleDetailMouseModels, header, headerFootnote, genotypeFootnote = d
             nextMaxKey = nextMaxKey + 1
 
             # If non-gene (transgenes, other mutations)...
@@ -462,7 +433,7 @@ def processMouse():
                 else:
                     diseaseMouseModels = 4
             else:
-                diseaseMouseModels = genotypeAlleleMouseModels[gcKey]
+                diseaseMouseModels = genotypeAlleleMouseModels[r['termID']]
 
             doBCP.write(
                     str(nextMaxKey) + COLDL +  \
@@ -481,16 +452,50 @@ def processMouse():
                     mgi_utils.prvalue(genotypeFootnote) + COLDL + \
                     cdate + COLDL + cdate + LINEDL)
 
+def processMouse():
+        #
+        # Purpose:  process Mouse records either by bcp
+        # Returns:
+        # Assumes:  temp table domouse1 exists
+        # Effects:
+        # Throws:
+        #
+        # The annotations are read once, ordered by genotype, and each
+        # genotype's records are handed to processGenotype() together.
+        #
+        # The marker symbol, allele symbol, DO term and ID and J number
+        # are resolved by the same query (mouseQuery; see mrkdobench.py
+        # for its comparison with resolving them through temp tables).
+        #
+
+        #
+        # process each individual marker/genotype record
+        #
+
+        results = mrkcachelib.streamSql(mouseQuery)
+
+        rows = []
+
+        for r in results:
+            if rows and r['_Genotype_key'] != rows[0]['_Genotype_key']:
+                processGenotype(rows)
+                rows = []
+            rows.append(r)
+
+        if rows:
+            processGenotype(rows)
+
 def selectHuman():
         #
         # Purpose:  selects the appropriate human annotation data
         # Returns:
         # Assumes:
-        # Effects:  initializes global dictionaries: mouseOrtholog, humanToDO, DOToHuman
+        # Effects:  initializes global dictionaries: mouseOrtholog, humanToDO, DOToHuman,
+        #           DOAllOrthologs
         # Throws:
         #
 
-        global mouseOrtholog, humanToDO, DOToHuman
+        global mouseOrtholog, humanToDO, DOToHuman, DOAllOrthologs
 
         #
         # select all human genes annotated to DO Gene or Disease Terms
@@ -529,14 +534,14 @@ def selectHuman():
             key = r['_Marker_key']
             value = r['termID']
             if key not in humanToDO:
-                humanToDO[key] = []
-            humanToDO[key].append(value)
+                humanToDO[key] = set()
+            humanToDO[key].add(value)
 
             key = r['termID']
             value = r['_Marker_key']
             if key not in DOToHuman:
-                DOToHuman[key] = []
-            DOToHuman[key].append(value)
+                DOToHuman[key] = set()
+            DOToHuman[key].add(value)
 
         #
         # resolve Jnumber
@@ -556,24 +561,24 @@ def selectHuman():
         #
         # resolve mouse ortholog
         #
-        results = db.sql('''select distinct o._Marker_key, cm2._Marker_key as orthologKey,
-                    m2.symbol as orthologSymbol
-                from domouse1 o, MRK_Cluster c1, MRK_ClusterMember cm1, MRK_Cluster c2,
-                    MRK_ClusterMember cm2, MRK_Marker m2
-                where o._Marker_key = cm1._Marker_key
-                and cm1._Cluster_key = c1._Cluster_key
-                and c1._ClusterType_key = 9272150
-                and c1._ClusterSource_key = 75885740
-                and c1._Cluster_key = c2._Cluster_key
-                and c2._Cluster_key = cm2._Cluster_key
-                and cm2._Marker_key = m2._Marker_key
-                and m2._Organism_key = %s
-                ''' % (mouseOrganismKey), 'auto')
+        results = mrkcachelib.streamSql('select distinct _Marker_key from domouse1')
 
         for r in results:
             key = r['_Marker_key']
-            value = r
-            mouseOrtholog[key] = value
+            orthologs = orthologGraph.membersOf(key, (mouseOrganismKey,))
+            if len(orthologs) > 0:
+                mouseOrtholog[key] = orthologs[-1][0]
+
+        #
+        # for each term, whether every human gene annotated to it
+        # has a mouse ortholog
+        #
+        for termID in DOToHuman:
+            DOAllOrthologs[termID] = 1
+            for g in DOToHuman[termID]:
+                if g not in mouseOrtholog:
+                    DOAllOrthologs[termID] = 0
+                    break
 
 def processDeleteReload():
         #
@@ -588,12 +593,36 @@ def processDeleteReload():
 
         print('%s' % mgi_utils.date())
 
-        doBCP = open(outDir + '/' + table + '.bcp', 'w')
+        doBCP = mrkcachelib.openOutput(table, outDir)
 
         #
         # select all mouse genotypes annotated to DO Disease Terms
         #
 
+        humanPairs = selectHumanAnnotations()
+
+        selectAnnotations('')
+        selectMouse()
+        selectHuman()
+        processMouse()
+        doBCP.close()
+
+        writeHumanSnapshot(humanPairs, pending = 1)
+
+        print('%s' % mgi_utils.date())
+
+def selectAnnotations(annotAnd):
+        #
+        # Purpose:  selects the mouse genotype-to-DO Disease annotations
+        # Returns:
+        # Assumes:
+        # Effects:  creates temp table domouse1
+        # Throws:
+        #
+        # annotAnd : additional condition on g._Genotype_key or a._Term_key;
+        #            '' for all annotations
+        #
+
         db.sql('''select g._Marker_key, g._Allele_key, g._Genotype_key, 
                 a._Term_key, q.term as qualifier, a._Qualifier_key, e._Refs_key 
                 INTO TEMPORARY TABLE domouse1 
@@ -602,13 +631,186 @@ def processDeleteReload():
                 and a._Qualifier_key = q._Term_key 
                 and a._AnnotType_key = %s
                 and a._Annot_key = e._Annot_key
-                ''' % (mouseDOannotationKey), None)
+                %s
+                ''' % (mouseDOannotationKey, annotAnd), None)
+
+def processIncremental(keyColumn, keyIn):
+        #
+        # Purpose:  refreshes the MRK_DO_Cache rows whose keyColumn is in keyIn
+        # Returns:
+        # Assumes:  keyColumn is _Genotype_key or _Term_key
+        # Effects:  deletes and re-inserts the rows in one transaction
+        # Throws:
+        #
+        # The display category 3 of a record depends only on the records of
+        # the same genotype and term, so recomputing every record of the
+        # affected genotypes (or terms) gives the same rows as a full reload.
+        #
+
+        global doBCP, nextMaxKey
+
+        if keyColumn == '_Genotype_key':
+            selectAnnotations('and g._Genotype_key in %s' % (keyIn))
+        else:
+            selectAnnotations('and a._Term_key in %s' % (keyIn))
 
         selectMouse()
         selectHuman()
-        cacheGenotypeDisplay3()
+
+        db.sql('lock table %s in exclusive mode' % (table), None)
+        db.sql('delete from %s where %s in %s' % (table, keyColumn, keyIn), None)
+
+        results = db.sql('select coalesce(max(_Cache_key), 0) as maxKey from %s' % (table), 'auto')
+        nextMaxKey = results[0]['maxKey']
+
+        doBCP = mrkcachelib.InsertWriter(table)
         processMouse()
         doBCP.close()
+        db.commit()
+
+        print('%d rows inserted' % (doBCP.count))
+
+def processByGenotype(genotypeKey, markerKey):
+        #
+        # Purpose:  refreshes the MRK_DO_Cache rows of one genotype, or of
+        #           every genotype of one marker
+        # Returns:
+        # Assumes:
+        # Effects:  see processIncremental()
+        # Throws:
+        #
+        # By marker, the affected genotypes are the marker's genotypes in
+        # GXD_AlleleGenotype plus any genotype it has cache rows for
+        # (in case the marker has since been removed from the genotype).
+        #
+
+        print('%s' % mgi_utils.date())
+
+        if genotypeKey is not None:
+            print('Processing by genotype key: %s' % (genotypeKey))
+            genotypeIn = '(%s)' % (genotypeKey)
+        else:
+            print('Processing by marker key: %s' % (markerKey))
+            genotypeIn = '''(select _Genotype_key from GXD_AlleleGenotype where _Marker_key = %s
+                union
+                select _Genotype_key from %s where _Marker_key = %s and _Organism_key = %s)
+                ''' % (markerKey, table, markerKey, mouseOrganismKey)
+
+        processIncremental('_Genotype_key', genotypeIn)
+
+        print('%s' % mgi_utils.date())
+
+def selectHumanAnnotations():
+        #
+        # Purpose:  selects the human marker/DO term ID pairs (annotation type 1022)
+        # Returns:  set of (human marker key, termID)
+        # Assumes:
+        # Effects:
+        # Throws:
+        #
+
+        pairs = set()
+
+        results = db.sql('''select distinct a._Object_key as _Marker_key, ac.accID as termID
+            from VOC_Annot a, ACC_Accession ac, MRK_Marker m
+            where a._AnnotType_key = %s
+            and a._Term_key = ac._Object_key
+            and ac._MGIType_key = 13
+            and ac.preferred = 1
+            and a._Object_key = m._Marker_key
+            ''' % (humanDOannotationKey), 'auto')
+
+        for r in results:
+            pairs.add((r['_Marker_key'], r['termID']))
+
+        return pairs
+
+def readHumanSnapshot():
+        #
+        # Purpose:  reads the human annotations saved by the last full or -H run
+        # Returns:  set of (human marker key, termID); None if there is no snapshot
+        # Assumes:
+        # Effects:
+        # Throws:
+        #
+
+        if not os.path.exists(humanSnapshot):
+            return None
+
+        pairs = set()
+        fp = open(humanSnapshot, 'r')
+        for line in fp.readlines():
+            markerKey, termID = str.split(line[:-1], COLDL)
+            pairs.add((int(markerKey), termID))
+        fp.close()
+
+        return pairs
+
+def writeHumanSnapshot(pairs, pending = 0):
+        #
+        # Purpose:  saves the human annotations for the next -H run
+        # Returns:
+        # Assumes:
+        # Effects:  writes humanSnapshot
+        # Throws:
+        #
+        # pending : the rows are not in MRK_DO_Cache yet (a full load);
+        #           write humanSnapshot.pending, which mrkcacheapply.csh
+        #           renames to humanSnapshot once they are
+        #
+
+        path = humanSnapshot
+        if pending:
+            path = path + '.pending'
+
+        fp = open(path + '.tmp', 'w')
+        for markerKey, termID in sorted(pairs):
+            fp.write(str(markerKey) + COLDL + termID + LINEDL)
+        fp.close()
+        os.rename(path + '.tmp', path)
+
+def processByTerm(termIDs):
+        #
+        # Purpose:  refreshes the MRK_DO_Cache rows of the given DO term IDs
+        # Returns:
+        # Assumes:
+        # Effects:  see processIncremental()
+        # Throws:
+        #
+        # A change in the human DO annotations (annotation type 1022) can
+        # change the category, header and footnotes of every mouse record
+        # of the terms involved, and of no others.
+        #
+        # termIDs : list of DO IDs; None to use the terms whose human
+        #           annotations changed since the last full or -H run
+        #
+
+        print('%s' % mgi_utils.date())
+
+        humanPairs = None
+
+        if termIDs is None:
+            previousPairs = readHumanSnapshot()
+            if previousPairs is None:
+                sys.stderr.write('%s does not exist; run a full load first\n' % (humanSnapshot))
+                sys.exit(1)
+
+            humanPairs = selectHumanAnnotations()
+            termIDs = sorted(set([termID for markerKey, termID in humanPairs ^ previousPairs]))
+
+        if len(termIDs) == 0:
+            print('No human DO annotations have changed')
+        else:
+            print('Processing by term: %s' % (str.join(',', termIDs)))
+            termIn = '''(select _Object_key from ACC_Accession
+                where _MGIType_key = 13
+                and preferred = 1
+                and accID in (%s))
+                ''' % (str.join(',', ["'%s'" % (t.replace("'", "''")) for t in termIDs]))
+            processIncremental('_Term_key', termIn)
+
+        if humanPairs is not None:
+            writeHumanSnapshot(humanPairs)
 
         print('%s' % mgi_utils.date())
 
@@ -616,49 +818,68 @@ def processDeleteReload():
 # Main Routine
 #
 
-print('%s' % mgi_utils.date())
+if __name__ == '__main__':
 
-try:
-        optlist, args = getopt.getopt(sys.argv[1:], 'S:D:U:P:K:')
-except:
-        showUsage()
-
-server = None
-database = None
-user = None
-password = None
-
-for opt in optlist:
-        if opt[0] == '-S':
-                server = opt[1]
-        elif opt[0] == '-D':
-                database = opt[1]
-        elif opt[0] == '-U':
-                user = opt[1]
-        elif opt[0] == '-P':
-                password = str.strip(open(opt[1], 'r').readline())
-        else:
+        print('%s' % mgi_utils.date())
+
+        try:
+                optlist, args = getopt.getopt(sys.argv[1:], 'S:D:U:P:K:M:T:H')
+        except:
                 showUsage()
 
-if server is None or \
-   database is None or \
-   user is None or \
-   password is None:
-        showUsage()
+        server = None
+        database = None
+        user = None
+        password = None
+        genotypeKey = None
+        markerKey = None
+        termIDs = None
+        humanChanges = 0
+
+        for opt in optlist:
+                if opt[0] == '-S':
+                        server = opt[1]
+                elif opt[0] == '-D':
+                        database = opt[1]
+                elif opt[0] == '-U':
+                        user = opt[1]
+                elif opt[0] == '-P':
+                        password = str.strip(open(opt[1], 'r').readline())
+                elif opt[0] == '-K':
+                        genotypeKey = int(opt[1])
+                elif opt[0] == '-M':
+                        markerKey = int(opt[1])
+                elif opt[0] == '-T':
+                        termIDs = str.split(opt[1], ',')
+                elif opt[0] == '-H':
+                        humanChanges = 1
+                else:
+                        showUsage()
 
-db.set_sqlLogin(user, password, server, database)
-db.useOneConnection(1)
+        if server is None or \
+           database is None or \
+           user is None or \
+           password is None:
+                showUsage()
 
-#
-# term key for 'not' qualifier
-#
+        db.set_sqlLogin(user, password, server, database)
+        db.useOneConnection(1)
 
-results = db.sql('''select _Term_key from VOC_Term where _Vocab_key = 53 and term like 'NOT%' ''', 'auto')
-for r in results:
-    notQualifier.append(r['_Term_key'])
+        #
+        # term key for 'not' qualifier
+        #
 
-processDeleteReload()
+        results = db.sql('''select _Term_key from VOC_Term where _Vocab_key = 53 and term like 'NOT%' ''', 'auto')
+        for r in results:
+            notQualifier.append(r['_Term_key'])
 
-db.useOneConnection(0)
+        if genotypeKey is not None or markerKey is not None:
+                processByGenotype(genotypeKey, markerKey)
+        elif termIDs is not None or humanChanges:
+                processByTerm(termIDs)
+        else:
+                processDeleteReload()
 
-print('%s' % mgi_utils.date())
+        db.useOneConnection(0)
+
+        print('%s' % mgi_utils.date())
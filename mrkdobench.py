@@ -0,0 +1,146 @@
+'''
+#
+# Purpose:
+#
+# Compares the two ways of resolving the mouse DO annotation records that
+# mrkdo.py writes to MRK_DO_Cache:
+#
+#	chain  : the temp table chain mrkdo.py used to build (domouse2,
+#		 domouse3, domouse4 and their indexes), then
+#		 'select * from domouse4'
+#	single : the one query processMouse() now streams (mrkdo.mouseQuery)
+#
+# The chain is kept here only for the comparison; mrkdo.py no longer
+# builds it.  The single query and domouse1 come from mrkdo.py itself,
+# so the benchmark measures what the load actually runs.
+#
+# Both start from the same domouse1 (the genotype-to-DO annotations) and
+# read every row through a server-side cursor.  For each, prints the rows
+# read, the wall time, and the temp space used: the size of the temp
+# tables it created plus the growth of pg_stat_database.temp_bytes (sort
+# and hash spill files).
+#
+# Uses environment variables to determine Server, Database and User
+#
+# Usage:
+#	mrkdobench.py
+#
+# History
+#
+'''
+
+import os
+import time
+import mgi_utils
+import db
+import mrkcachelib
+import mrkdo
+
+chainTables = ['domouse2', 'domouse3', 'domouse4']
+
+chainCmds = [
+        '''select o.*, m._Organism_key, m.symbol as markerSymbol, m._Marker_Type_key, a.symbol as alleleSymbol
+                INTO TEMPORARY TABLE domouse2
+                from domouse1 o, MRK_Marker m, ALL_Allele a
+                where o._Marker_key = m._Marker_key
+                and o._Allele_key = a._Allele_key
+                ''',
+        'create index idx3 on domouse2(_Marker_key)',
+        '''select o.*, t.term, a.accID as termID
+                INTO TEMPORARY TABLE domouse3
+                from domouse2 o, VOC_Term t, ACC_Accession a
+                where o._Term_key = t._Term_key
+                and o._Term_key = a._Object_key
+                and a._MGIType_key = 13
+                and a.preferred = 1
+                ''',
+        'create index idx4 on domouse3(_Refs_key)',
+        '''select o.*, a.accID as jnumID
+                INTO TEMPORARY TABLE domouse4
+                from domouse3 o, ACC_Accession a
+                where o._Refs_key = a._Object_key
+                and a._MGIType_key = 1
+                and a._LogicalDB_key = 1
+                and a.prefixPart = 'J:'
+                and a.preferred = 1
+                ''',
+        'create index idx5 on domouse4(_Genotype_key)',
+        'create index idx6 on domouse4(_Allele_key)',
+        ]
+
+chainQuery = 'select * from domouse4 order by _Genotype_key, alleleSymbol, term'
+
+def tempBytes():
+        #
+        # Purpose: returns the temp file bytes written so far in this database
+        #
+
+        results = db.sql('''select temp_bytes from pg_stat_database
+                where datname = current_database()''', 'auto')
+        return results[0]['temp_bytes']
+
+def tableBytes(tables):
+        #
+        # Purpose: returns the total size of the given temp tables and their indexes
+        #
+
+        total = 0
+        for t in tables:
+            results = db.sql("select pg_total_relation_size('%s') as bytes" % (t), 'auto')
+            total = total + results[0]['bytes']
+        return total
+
+def run(name, cmds, query, tables):
+        #
+        # Purpose: runs cmds, then reads every row of query
+        # Effects: prints rows, wall time and temp space
+        #
+
+        startBytes = tempBytes()
+        start = time.time()
+
+        for cmd in cmds:
+            db.sql(cmd, None)
+
+        rows = 0
+        for r in mrkcachelib.streamSql(query):
+            rows = rows + 1
+
+        elapsed = time.time() - start
+        created = tableBytes(tables)
+
+        # pg_stat_database is updated when the statistics are flushed
+        time.sleep(1)
+        spilled = tempBytes() - startBytes
+
+        print('%-8s %10d rows %10.2f sec %12d temp table bytes %12d temp file bytes' \
+                % (name, rows, elapsed, created, spilled))
+
+        for t in tables:
+            db.sql('drop table %s' % (t), None)
+
+#
+# Main Routine
+#
+
+user = os.environ['MGD_DBUSER']
+passwordFile = os.environ['MGD_DBPASSWORDFILE']
+password = str.strip(open(passwordFile, 'r').readline())
+db.set_sqlUser(user)
+db.set_sqlPassword(password)
+
+db.useOneConnection(1)
+
+print('%s' % mgi_utils.date())
+
+mrkdo.selectAnnotations('')
+db.sql('create index idx1 on domouse1(_Marker_key)', None)
+db.sql('create index idx2 on domouse1(_Allele_key)', None)
+db.sql('analyze domouse1', None)
+
+run('chain', chainCmds, chainQuery, chainTables)
+run('single', [], mrkdo.mouseQuery, [])
+
+db.useOneConnection(0)
+
+print('%s' % mgi_utils.date())
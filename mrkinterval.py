@@ -0,0 +1,187 @@
+'''
+#
+# Purpose:
+#
+# A genomic interval index of the MRK_Location_Cache coordinates, for
+# "which markers overlap chromosome:start-end" without range scans of
+# startCoordinate/endCoordinate.
+#
+# mrklocation.py writes the index (IntervalWriter) in the same pass that
+# writes the cache rows, when MRKCACHEINTERVALINDEX is set:
+#
+#	${MRKCACHEBCPDIR}/MRK_Location_Cache.intervals
+#
+# The index is rebuilt by full loads only; a per-marker or per-collection
+# refresh of MRK_Location_Cache leaves it as it was.
+#
+# Format (little-endian):
+#
+#	header    : magic 'MRKIVX1\n', binSize (uint32), chromosomes (uint32)
+#	directory : per chromosome: name (16 bytes, null padded),
+#		    intervals (uint32), maxLength (uint32), bins (uint32),
+#		    binOffset (uint64), intervalOffset (uint64)
+#	bins      : per chromosome, per bin: the index of its first interval
+#		    with start >= bin * binSize (uint32)
+#	intervals : per chromosome, sorted by start: start, end,
+#		    _Marker_key (uint32 each)
+#
+# An overlap query starts at the bin of (start - maxLength), the furthest
+# back an overlapping interval can start, and reads forward until the
+# intervals start past end.
+#
+# Usage:
+#	mrkinterval.py indexfile chromosome:start-end
+#
+# History
+#
+'''
+
+import sys
+import os
+import mmap
+import struct
+import bisect
+from array import array
+
+magic = b'MRKIVX1\n'
+header = struct.Struct('<8sII')
+entry = struct.Struct('<16sIIIQQ')
+binEntry = struct.Struct('<I')
+interval = struct.Struct('<III')
+
+try:
+    binSize = int(os.environ['MRKCACHEINTERVALBINSIZE'])
+except:
+    binSize = 100000
+
+class IntervalWriter:
+        #
+        # Purpose: collects the intervals of a load, writes the index on close()
+        #
+        # Used like the load's other outputs: add() per coordinate,
+        # close() when the load succeeds, abort() when it fails.  The
+        # index is written to <path>.tmp and renamed into place.
+        #
+
+        def __init__(self, path):
+            self.path = path
+            self.chromosomes = {}	# chromosome : array of start, end, marker key
+
+        def add(self, chromosome, start, end, markerKey):
+            if chromosome in (None, '') or start in (None, '') or end in (None, ''):
+                return
+
+            start = int(float(start))
+            end = int(float(end))
+            if start > end:
+                start, end = end, start
+
+            if chromosome not in self.chromosomes:
+                self.chromosomes[chromosome] = array('L')
+            self.chromosomes[chromosome].extend((start, end, int(markerKey)))
+
+        def close(self):
+            names = sorted(self.chromosomes)
+            sections = []
+
+            for name in names:
+                values = self.chromosomes[name]
+                intervals = sorted(zip(values[0::3], values[1::3], values[2::3]))
+                starts = [i[0] for i in intervals]
+                maxLength = max([i[1] - i[0] for i in intervals])
+                bins = [bisect.bisect_left(starts, b * binSize) \
+                        for b in range(starts[-1] // binSize + 1)]
+                sections.append((name, intervals, maxLength, bins))
+
+            offset = header.size + entry.size * len(sections)
+
+            fp = open(self.path + '.tmp', 'wb')
+            fp.write(header.pack(magic, binSize, len(sections)))
+
+            for name, intervals, maxLength, bins in sections:
+                binOffset = offset
+                intervalOffset = binOffset + binEntry.size * len(bins)
+                offset = intervalOffset + interval.size * len(intervals)
+                fp.write(entry.pack(name.encode(), len(intervals), maxLength, len(bins), binOffset, intervalOffset))
+
+            for name, intervals, maxLength, bins in sections:
+                fp.write(struct.pack('<%dI' % (len(bins)), *bins))
+                for i in intervals:
+                    fp.write(interval.pack(*i))
+
+            fp.close()
+            os.rename(self.path + '.tmp', self.path)
+            self.chromosomes = {}
+
+        def abort(self):
+            self.chromosomes = {}
+
+class IntervalIndex:
+        #
+        # Purpose: answers overlap queries against an index file
+        #
+
+        def __init__(self, path):
+            self.fp = open(path, 'rb')
+            self.map = mmap.mmap(self.fp.fileno(), 0, access = mmap.ACCESS_READ)
+
+            tag, self.binSize, count = header.unpack_from(self.map, 0)
+            if tag != magic:
+                raise ValueError('%s is not an interval index' % (path))
+
+            self.chromosomes = {}
+            for i in range(count):
+                name, intervals, maxLength, bins, binOffset, intervalOffset = \
+                        entry.unpack_from(self.map, header.size + i * entry.size)
+                self.chromosomes[name.rstrip(b'\0').decode()] = \
+                        (intervals, maxLength, bins, binOffset, intervalOffset)
+
+        def overlaps(self, chromosome, start, end):
+            #
+            # Purpose: the intervals overlapping chromosome:start-end
+            # Returns: list of (start, end, marker key), sorted by start
+            #
+
+            if chromosome not in self.chromosomes:
+                return []
+
+            intervals, maxLength, bins, binOffset, intervalOffset = self.chromosomes[chromosome]
+
+            b = max(0, start - maxLength) // self.binSize
+            if b >= bins:
+                return []
+
+            i = binEntry.unpack_from(self.map, binOffset + b * binEntry.size)[0]
+            found = []
+
+            while i < intervals:
+                s, e, markerKey = interval.unpack_from(self.map, intervalOffset + i * interval.size)
+                if s > end:
+                    break
+                if e >= start:
+                    found.append((s, e, markerKey))
+                i = i + 1
+
+            return found
+
+        def close(self):
+            self.map.close()
+            self.fp.close()
+
+#
+# Main Routine
+#
+
+if __name__ == '__main__':
+
+        if len(sys.argv) != 3:
+                sys.stderr.write('usage: %s indexfile chromosome:start-end\n' % sys.argv[0])
+                sys.exit(1)
+
+        chromosome, coordinates = sys.argv[2].rsplit(':', 1)
+        start, end = [int(c) for c in coordinates.split('-')]
+
+        index = IntervalIndex(sys.argv[1])
+        for s, e, markerKey in index.overlaps(chromosome, start, end):
+            print('%s\t%s\t%s\t%s' % (chromosome, s, e, markerKey))
+        index.close()
@@ -8,9 +8,40 @@
 # Uses environment variables to determine Server and Database
 #
 # Usage:
-#	mrklabel.py [markerkey]
+#	mrklabel.py [-P priority[,priority...]] [-O mouse|human|rat|other[,...]] [markerkey]
 #
-# If markerkey is provided, then only create the bcp file for that marker.
+# If markerkey is provided, then only the labels of that marker and of its
+# orthologs are selected, and they replace that marker's and its orthologs'
+# rows in MRK_Label directly (no bcp file), in one transaction.
+#
+# -P selects priorities, and -O the priorities of an organism's labels
+# (e.g. -O human : 8, 11, 12; see organismPriorities); then only those
+# priorities are run, and their rows replace the same priorities' rows
+# in MRK_Label directly, as above.  The other rows keep their keys.
+#
+# With MRKCACHELABELDEDUP=1, a label is only written for a marker once:
+# a record whose label, normalized (mrkcachelib.normalizeLabel), is the
+# same as that of a higher priority record of the same marker is dropped.
+# It cannot be used with -P/-O: a run of some priorities could not bring
+# back the lower priority rows an earlier dedup dropped, once their higher
+# priority duplicate changes, so MRK_Label would drift from a full load.
+#
+# With MRKCACHELABELNORMALIZED=1, each record also gets the normalized
+# form of its label as a last column, for equality lookups that would
+# otherwise compare lower()/regexp_replace() of label at query time.
+# MRK_Label must have that column (and its index) first:
+#
+#	alter table mgd.MRK_Label add column normalizedLabel text null;
+#	create index idx_MRK_Label_normalizedLabel on mgd.MRK_Label (normalizedLabel);
+#
+# A lookup normalizes its value the same way, with normalizeLabel() in
+# mrkcachelib.py, and compares it with normalizedLabel.
+#
+# The label priorities run in groups on MRKCACHELABELWORKERS connections
+# at once.  Each priority writes its records to a shard file, each query's
+# records ordered by marker and label, and the shards are merged into the
+# bcp file in priority order, so the records and their _Label_key values
+# are the same from run to run, whatever the number of workers.
 #
 # History
 #
@@ -67,8 +98,13 @@
 
 import sys
 import os
+import getopt
+import threading
+import concurrent.futures
 import mgi_utils
 import db
+import mrkcachelib
+import mrkortholog
 
 try:
     BCPDL = os.environ['COLDELIM']
@@ -77,10 +113,31 @@ try:
 except:
     table = 'MRK_Label'
 
+try:
+    workers = int(os.environ['MRKCACHELABELWORKERS'])
+except:
+    workers = 4
+
+try:
+    dedup = os.environ['MRKCACHELABELDEDUP'] == '1'
+except:
+    dedup = 0
+
+try:
+    normalized = os.environ['MRKCACHELABELNORMALIZED'] == '1'
+except:
+    normalized = 0
+
+seen = set()	# (marker key, normalized label) already written (see mergeShards)
+
 NL = '\n'
-labelKey = 1
+local = threading.local()	# conn, shard : the worker's connection and current shard
+partitions = {}			# organism (2, 40, None for other) : ortholog pairs (see partitionOrthology)
 cdate = mgi_utils.date("%m/%d/%Y")
 
+# the order of each priority query's rows (see query)
+shardOrder = 'order by _Marker_key, label, _OrthologOrganism_key\n'
+
 #
 # priority	label type	label name
 #
@@ -113,11 +170,28 @@ cdate = mgi_utils.date("%m/%d/%Y")
 #
 #
 
+def query(cmd):
+
+    # runs cmd on the worker's connection (see runWorker), ordered by
+    # marker and label, so that a shard is written in the same order
+    # whatever the number of workers
+
+    return mrkcachelib.streamConnection(local.conn, cmd + shardOrder)
+
+def execute(cmd):
+
+    # executes cmd on the worker's connection (see runWorker)
+
+    local.conn.cursor().execute(cmd)
+
 def writeRecord(results, labelStatusKey, priority, labelType, labelTypeName):
 
-    global labelKey
+    # writes the records to the priority's shard, as they are read;
+    # the _Label_key is added when the shards are merged (see mergeShards)
+
     originalLTN = labelTypeName
-    
+    count = 0
+
     for r in results:
 
         if originalLTN is None:
@@ -125,8 +199,7 @@ def writeRecord(results, labelStatusKey, priority, labelType, labelTypeName):
 
         newLabel = r['label'].replace('|', '#')
 
-        outBCP.write(mgi_utils.prvalue(labelKey) + BCPDL + \
-                mgi_utils.prvalue(r['_Marker_key']) + BCPDL + \
+        local.shard.write(mgi_utils.prvalue(r['_Marker_key']) + BCPDL + \
                 mgi_utils.prvalue(labelStatusKey) + BCPDL + \
                 mgi_utils.prvalue(r['_Organism_key']) + BCPDL + \
                 mgi_utils.prvalue(r['_OrthologOrganism_key']) + BCPDL + \
@@ -135,11 +208,79 @@ def writeRecord(results, labelStatusKey, priority, labelType, labelTypeName):
                 mgi_utils.prvalue(labelType) + BCPDL + \
                 mgi_utils.prvalue(labelTypeName) + BCPDL + \
                 cdate + BCPDL + \
-                cdate + NL)
+                cdate + normalizedColumn(newLabel) + NL)
+        count = count + 1
+
+    print('processed (%d) records...%s' % (count, mgi_utils.date()))
+
+def partitionOrthology():
+
+        # reads all mouse/non-mouse homologies from the Alliance direct
+        # homology (graph), in one pass over the graph, into partitions:
+        #	2    : human
+        #	40   : rat
+        #	None : other organisms
+        #
+        # as (mouse marker key, ortholog marker key, mouse organism key,
+        # ortholog organism key); each ortholog group's worker loads only
+        # its own partition (see selectOrthology)
+
+        print('processing orthology...%s' % mgi_utils.date())
+
+        for organism in (2, 40, None):
+                partitions[organism] = []
+
+        for pair in graph.pairs(1, (1,), exclude = 1, markerKey = markerKey):
+                partitions.get(pair[3], partitions[None]).append(pair)
+
+        print('processed (%d, %d, %d) human, rat, other orthologs...%s' \
+                % (len(partitions[2]), len(partitions[40]), len(partitions[None]), mgi_utils.date()))
+
+def selectOrthology(organism):
+
+        # build a temp table (#orthology) with four columns:
+        #	_Marker_key           : mouse marker key
+        #	m2                    : ortholog (non-mouse) marker key
+        #	_Organism_key         : mouse organism key (1)
+        #	_OrthologOrganism_key : ortholog organism key
+        #
+        # on the worker's connection, from one partition of the orthologs
+        # (see partitionOrthology)
+
+        execute('''create temporary table orthology (
+                _Marker_key int not null,
+                m2 int not null,
+                _Organism_key int not null,
+                _OrthologOrganism_key int not null)
+                ''')
 
-        labelKey = labelKey + 1
+        orthologs = mrkcachelib.InsertWriter('orthology', conn = local.conn)
 
-    print('processed (%d) records...%s' % (len(results), mgi_utils.date()))
+        for pair in partitions[organism]:
+                orthologs.write(str.join(BCPDL, [str(k) for k in pair]) + NL)
+
+        orthologs.close()
+
+        execute('create index idx1 on orthology(_OrthologOrganism_key, m2)')
+        execute('analyze orthology')
+
+def humanOrthology():
+
+        # priorities 8, 11, 12
+
+        selectOrthology(2)
+
+def ratOrthology():
+
+        # priorities 9, 13
+
+        selectOrthology(40)
+
+def otherOrthology():
+
+        # priority 14
+
+        selectOrthology(None)
 
 def priority1():
 
@@ -156,7 +297,7 @@ def priority1():
         if markerKey is not None:
                 cmd = cmd + 'and _Marker_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 1, 'MS', 'current symbol')
+        writeRecord(query(cmd), 1, 1, 'MS', 'current symbol')
 
 def priority2():
 
@@ -173,7 +314,7 @@ def priority2():
         if markerKey is not None:
                 cmd = cmd + 'and _Marker_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 2, 'MN', 'current name')
+        writeRecord(query(cmd), 1, 2, 'MN', 'current name')
 
 def priority3():
 
@@ -191,7 +332,7 @@ def priority3():
         if markerKey is not None:
                 cmd = cmd + 'and a._Marker_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 3, 'AS', 'allele symbol')
+        writeRecord(query(cmd), 1, 3, 'AS', 'allele symbol')
 
 def priority4():
 
@@ -208,7 +349,7 @@ def priority4():
         if markerKey is not None:
                 cmd = cmd + 'and a._Marker_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 4, 'AN', 'allele name')
+        writeRecord(query(cmd), 1, 4, 'AN', 'allele name')
 
 def priority5():
         
@@ -226,7 +367,7 @@ def priority5():
         if markerKey is not None:
                 cmd = cmd + 'and h._Marker_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 2, 5, 'MS', 'old symbol')
+        writeRecord(query(cmd), 2, 5, 'MS', 'old symbol')
 
 def priority6():
 
@@ -246,7 +387,7 @@ def priority6():
         if markerKey is not None:
                 cmd = cmd + 'and h._Marker_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 2, 6, 'MN', 'old name')
+        writeRecord(query(cmd), 2, 6, 'MN', 'old name')
 
 def priority7():
 
@@ -264,7 +405,7 @@ def priority7():
         if markerKey is not None:
                 cmd = cmd + 'and s._Object_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 7, 'MY', 'synonym')
+        writeRecord(query(cmd), 1, 7, 'MY', 'synonym')
 
 def priority8():
 
@@ -272,57 +413,18 @@ def priority8():
 
         print('processing priority 8...%s' % mgi_utils.date())
 
-        # build a temp table (#orthology1) with four columns:
-        #	_Marker_key           : mouse marker key
-        #	m2                    : human marker key
-        #	_Organism_key         : mouse organism key (1)
-        #	_OrthologOrganism_key : human organism key (2)
-        #
-        # and populate it with mouse/human homologies from the Alliance
-        # direct homology
-
-        cmd = '''select distinct mouse._Marker_key,
-                        human._Marker_key as m2,
-                        mm._Organism_key,
-                        hm._Organism_key as _OrthologOrganism_key
-                INTO TEMPORARY TABLE orthology1
-                from VOC_Term vt,
-                        MRK_Cluster mc,
-                        MRK_ClusterMember mouse,
-                        MRK_Marker mm,
-                        MRK_ClusterMember human,
-                        MRK_Marker hm
-                where vt._Term_key = 75885739
-                        and vt._Term_key = mc._ClusterSource_key
-                        and mc._Cluster_key = mouse._Cluster_key
-                        and mouse._Marker_key = mm._Marker_key
-                        and mm._Organism_key = 1
-                        and mc._Cluster_key = human._Cluster_key
-                        and human._Marker_key = hm._Marker_key
-                        and hm._Organism_key = 2
-                '''
-
-        if markerKey is not None:
-                cmd = cmd + 'and mm._Marker_key = %s\n' % markerKey
-
-        db.sql(cmd, None)
-        db.sql('create index idx3 on orthology1(m2)', None)
-        db.sql('create index idx4 on orthology1(_OrthologOrganism_key)', None)
-
         # human synonym
 
         cmd = '''select distinct o._Marker_key, o._Organism_key, o._OrthologOrganism_key, s.synonym as label
-                from orthology1 o, MGI_SynonymType st, MGI_Synonym s
-                where st._MGIType_key = 2 
+                from orthology o, MGI_SynonymType st, MGI_Synonym s
+                where o._OrthologOrganism_key = 2
+                and st._MGIType_key = 2 
                 and st._Organism_key = o._OrthologOrganism_key 
                 and st._SynonymType_key = s._SynonymType_key
                 and o.m2 = s._Object_key 
                 '''
 
-        if markerKey is not None:
-                cmd = cmd + 'and s._Object_key = %s\n' % markerKey
-
-        writeRecord(db.sql(cmd, 'auto'), 1, 8, 'MY', 'human synonym')
+        writeRecord(query(cmd), 1, 8, 'MY', 'human synonym')
 
 def priority9():
 
@@ -330,57 +432,18 @@ def priority9():
 
         print('processing priority 9...%s' % mgi_utils.date())
 
-        # build a temp table (#orthology2) with four columns:
-        #	_Marker_key           : mouse marker key
-        #	m2                    : rat marker key
-        #	_Organism_key         : mouse organism key (1)
-        #	_OrthologOrganism_key : rat organism key (40)
-        #
-        # and populate it with mouse/rat homologies from the Alliance
-        # direct homology
-
-        cmd = '''select distinct mouse._Marker_key,
-                        human._Marker_key as m2,
-                        mm._Organism_key,
-                        hm._Organism_key as _OrthologOrganism_key
-                INTO TEMPORARY TABLE orthology2
-                from VOC_Term vt,
-                        MRK_Cluster mc,
-                        MRK_ClusterMember mouse,
-                        MRK_Marker mm,
-                        MRK_ClusterMember human,
-                        MRK_Marker hm
-                where vt._Term_key = 75885739
-                        and vt._Term_key = mc._ClusterSource_key
-                        and mc._Cluster_key = mouse._Cluster_key
-                        and mouse._Marker_key = mm._Marker_key
-                        and mm._Organism_key = 1
-                        and mc._Cluster_key = human._Cluster_key
-                        and human._Marker_key = hm._Marker_key
-                        and hm._Organism_key = 40
-                '''
-
-        if markerKey is not None:
-                cmd = cmd + 'and mm._Marker_key = %s\n' % markerKey
-
-        db.sql(cmd, None)
-        db.sql('create index idx5 on orthology2(m2)', None)
-        db.sql('create index idx6 on orthology2(_OrthologOrganism_key)', None)
-
         # rat synonym
 
         cmd = '''select distinct o._Marker_key, o._Organism_key, o._OrthologOrganism_key, s.synonym as label 
-                from orthology2 o, MGI_SynonymType st, MGI_Synonym s 
-                where st._MGIType_key = 2 
+                from orthology o, MGI_SynonymType st, MGI_Synonym s 
+                where o._OrthologOrganism_key = 40
+                and st._MGIType_key = 2 
                 and st._Organism_key = o._OrthologOrganism_key 
                 and st._SynonymType_key = s._SynonymType_key 
                 and o.m2 = s._Object_key 
                 '''
 
-        if markerKey is not None:
-                cmd = cmd + 'and s._Object_key = %s\n' % markerKey
-
-        writeRecord(db.sql(cmd, 'auto'), 1, 9, 'MY', 'rat synonym')
+        writeRecord(query(cmd), 1, 9, 'MY', 'rat synonym')
 
 def priority10():
 
@@ -399,7 +462,7 @@ def priority10():
         if markerKey is not None:
                 cmd = cmd + 'and s._Object_key = %s\n' % markerKey
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 10, 'MY', 'related synonym')
+        writeRecord(query(cmd), 1, 10, 'MY', 'related synonym')
 
 def priority11():
 
@@ -408,12 +471,13 @@ def priority11():
         print('processing priority 11...%s' % mgi_utils.date())
 
         cmd = '''select o.*, m.symbol as label, s.commonName || ' symbol' as labelTypeName
-                from orthology1 o, MRK_Marker m, MGI_Organism s
-                where o.m2 = m._Marker_key 
+                from orthology o, MRK_Marker m, MGI_Organism s
+                where o._OrthologOrganism_key = 2
+                and o.m2 = m._Marker_key 
                 and o._OrthologOrganism_key = s._Organism_key 
                 '''
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 11, 'OS', None)
+        writeRecord(query(cmd), 1, 11, 'OS', None)
 
         # human symbol
 
@@ -422,7 +486,10 @@ def priority11():
                 where _Organism_key = 2 
                 '''
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 11, 'MS', 'current symbol')
+        if markerKey is not None:
+                cmd = cmd + 'and _Marker_key in %s\n' % markerScope
+
+        writeRecord(query(cmd), 1, 11, 'MS', 'current symbol')
 
 def priority12():
 
@@ -431,12 +498,13 @@ def priority12():
         print('processing priority 12...%s' % mgi_utils.date())
 
         cmd = '''select o.*, m.name as label, s.commonName || ' name' as labelTypeName 
-                from orthology1 o, MRK_Marker m, MGI_Organism s 
-                where o.m2 = m._Marker_key 
+                from orthology o, MRK_Marker m, MGI_Organism s 
+                where o._OrthologOrganism_key = 2
+                and o.m2 = m._Marker_key 
                 and o._OrthologOrganism_key = s._Organism_key 
                 '''
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 12, 'ON', None)
+        writeRecord(query(cmd), 1, 12, 'ON', None)
 
         # human name
 
@@ -445,7 +513,10 @@ def priority12():
                 where _Organism_key = 2
                 '''
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 12, 'MN', 'current name')
+        if markerKey is not None:
+                cmd = cmd + 'and _Marker_key in %s\n' % markerScope
+
+        writeRecord(query(cmd), 1, 12, 'MN', 'current name')
 
 def priority13():
 
@@ -454,30 +525,37 @@ def priority13():
         print('processing priority 13...%s' % mgi_utils.date())
 
         cmd = '''select o.*, m.symbol as label, s.commonName || ' symbol' as labelTypeName 
-                from orthology2 o, MRK_Marker m, MGI_Organism s 
-                where o.m2 = m._Marker_key 
+                from orthology o, MRK_Marker m, MGI_Organism s 
+                where o._OrthologOrganism_key = 40
+                and o.m2 = m._Marker_key 
                 and o._OrthologOrganism_key = s._Organism_key 
                 '''
 
         # rat symbol
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 13, 'OS', None)
+        writeRecord(query(cmd), 1, 13, 'OS', None)
 
         cmd = '''select _Marker_key, _Organism_key, null as _OrthologOrganism_key, symbol as label 
                 from MRK_Marker 
                 where _Organism_key = 40 
                 '''
 
+        if markerKey is not None:
+                cmd = cmd + 'and _Marker_key in %s\n' % markerScope
+
         # rat name
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 13, 'MS', 'current symbol')
+        writeRecord(query(cmd), 1, 13, 'MS', 'current symbol')
 
         cmd = '''select _Marker_key, _Organism_key, null as _OrthologOrganism_key , name as label
                 from MRK_Marker 
                 where _Organism_key = 40 
                 '''
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 13, 'MN', 'current name')
+        if markerKey is not None:
+                cmd = cmd + 'and _Marker_key in %s\n' % markerScope
+
+        writeRecord(query(cmd), 1, 13, 'MN', 'current name')
 
 def priority14():
 
@@ -485,58 +563,22 @@ def priority14():
 
         print('processing priority 14...%s' % mgi_utils.date())
 
-        # build a temp table (#orthology3) with four columns:
-        #	_Marker_key           : mouse marker key
-        #	m2                    : non-human/rat/mouse marker key
-        #	_Organism_key         : mouse organism key (1)
-        #	_OrthologOrganism_key : non-human/rat/mouse organism key
-        #
-        # and populate it with mouse/other (non-rat, non-human, non-mouse)
-        # homologies from the Alliance direct homology
-
-        cmd = '''select distinct mouse._Marker_key,
-                        human._Marker_key as m2,
-                        mm._Organism_key,
-                        hm._Organism_key as _OrthologOrganism_key
-                INTO TEMPORARY TABLE orthology3
-                from VOC_Term vt,
-                        MRK_Cluster mc,
-                        MRK_ClusterMember mouse,
-                        MRK_Marker mm,
-                        MRK_ClusterMember human,
-                        MRK_Marker hm
-                where vt._Term_key = 75885739
-                        and vt._Term_key = mc._ClusterSource_key
-                        and mc._Cluster_key = mouse._Cluster_key
-                        and mouse._Marker_key = mm._Marker_key
-                        and mm._Organism_key = 1
-                        and mc._Cluster_key = human._Cluster_key
-                        and human._Marker_key = hm._Marker_key
-                        and hm._Organism_key not in (1, 2, 40)
-                '''
-
-        if markerKey is not None:
-                cmd = cmd + 'and mm._Marker_key = %s\n' % markerKey
-
-        db.sql(cmd, None)
-        db.sql('create index idx1 on orthology3(m2)', None)
-        db.sql('create index idx2 on orthology3(_OrthologOrganism_key)', None)
-
         cmd = '''select o.*, m.symbol as label, s.commonName || ' symbol' as labelTypeName 
-                from orthology3 o, MRK_Marker m, MGI_Organism s 
-                where o.m2 = m._Marker_key 
+                from orthology o, MRK_Marker m, MGI_Organism s 
+                where o._OrthologOrganism_key not in (1, 2, 40)
+                and o.m2 = m._Marker_key 
                 and o._OrthologOrganism_key = s._Organism_key 
                 '''
 
-        homologs = db.sql(cmd, 'auto')
-
         # tweak organism names as needed
 
-        for row in homologs:
-                row['labelTypeName'] = row['labelTypeName'].replace (
-                        ', domestic', '')
+        def homologs():
+                for row in query(cmd):
+                        row['labelTypeName'] = row['labelTypeName'].replace (
+                                ', domestic', '')
+                        yield row
 
-        writeRecord(homologs, 1, 14, 'OS', None)
+        writeRecord(homologs(), 1, 14, 'OS', None)
 
         # other symbol
 
@@ -546,9 +588,9 @@ def priority14():
                 '''
 
         if markerKey is not None:
-                cmd = cmd + 'and _Marker_key = %s\n' % markerKey
+                cmd = cmd + 'and _Marker_key in %s\n' % markerScope
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 14, 'MS', 'current symbol')
+        writeRecord(query(cmd), 1, 14, 'MS', 'current symbol')
 
         # other name
 
@@ -558,9 +600,144 @@ def priority14():
                 '''
 
         if markerKey is not None:
-                cmd = cmd + 'and _Marker_key = %s\n' % markerKey
+                cmd = cmd + 'and _Marker_key in %s\n' % markerScope
+
+        writeRecord(query(cmd), 1, 14, 'MN', 'current name')
+
+def runWorker(g):
+
+        # runs groups[g] on a connection of its own, each of its
+        # priorities writing its own shard
+
+        local.conn = mrkcachelib.connect()
+
+        try:
+                for f in groups[g]:
+                        if f in orthologySteps:
+                                f()
+                                continue
+                        local.shard = open(shardPath(priorityOf(f)), 'w')
+                        f()
+                        local.shard.close()
+        finally:
+                local.conn.rollback()
+                local.conn.close()
+
+def priorityOf(f):
+
+        # the priority of a priority function (priorityN)
+
+        return int(f.__name__[8:])
+
+def selectedPriorities():
+
+        # the priorities in groups, in _Label_key order
+
+        return sorted([priorityOf(f) for group in groups for f in group if f not in orthologySteps])
+
+def shardPath(priority):
+
+        return '%s/%s.%d.shard' % (outDir, table, priority)
+
+def removeShards():
+
+        # removes the shards of a failed run
+
+        for priority in selectedPriorities():
+                if os.path.exists(shardPath(priority)):
+                        os.remove(shardPath(priority))
+
+def normalizedColumn(label):
+
+        # the normalizedLabel column, if MRK_Label has one
+
+        if normalized:
+                return BCPDL + mrkcachelib.normalizeLabel(label)
+        return ''
+
+def mergeShards(labelKey):
+
+        # writes the shards to outBCP in priority order, numbering
+        # the records from labelKey as a serial run would
+        #
+        # with MRKCACHELABELDEDUP, a record whose (marker, normalized
+        # label) has already been written is dropped, so only the highest
+        # priority occurrence of a label is kept
+
+        dropped = 0
+
+        for priority in selectedPriorities():
+                fp = open(shardPath(priority), 'r')
+                for line in fp:
+                        if dedup:
+                                fields = str.split(line, BCPDL)
+                                key = (int(fields[0]), mrkcachelib.normalizeLabel(fields[5]))
+                                if key in seen:
+                                        dropped = dropped + 1
+                                        continue
+                                seen.add(key)
+                        outBCP.write(mgi_utils.prvalue(labelKey) + BCPDL + line)
+                        labelKey = labelKey + 1
+                fp.close()
+                os.remove(shardPath(priority))
 
-        writeRecord(db.sql(cmd, 'auto'), 1, 14, 'MN', 'current name')
+        if dedup:
+                print('dedup dropped (%d) duplicate records...%s' % (dropped, mgi_utils.date()))
+
+        print('merged records...%s' % (mgi_utils.date()))
+
+#
+# priorities, grouped by the worker that runs them (the shards are
+# merged in priority order, whatever the group); the ortholog groups
+# first build their own #orthology from their organism's partition
+# (temp tables belong to the connection that creates them)
+#
+
+orthologySteps = [humanOrthology, ratOrthology, otherOrthology]
+
+groups = [
+        [humanOrthology, priority8, priority11, priority12],
+        [ratOrthology, priority9, priority13],
+        [otherOrthology, priority14],
+        [priority1, priority2],
+        [priority3, priority4],
+        [priority5, priority6],
+        [priority7],
+        [priority10],
+        ]
+
+#
+# the priorities of each organism's labels (-O)
+#
+
+organismPriorities = {
+        'mouse' : [1, 2, 3, 4, 5, 6, 7, 10],
+        'human' : [8, 11, 12],
+        'rat' : [9, 13],
+        'other' : [14],
+        }
+
+def selectGroups(priorities):
+
+        # returns groups, less the priorities that are not in priorities
+        # (and the #orthology of any group left without one)
+
+        selected = []
+
+        for group in groups:
+                kept = [p for p in group if p not in orthologySteps and priorityOf(p) in priorities]
+                if len(kept) == 0:
+                        continue
+                if group[0] in orthologySteps:
+                        kept.insert(0, group[0])
+                selected.append(kept)
+
+        return selected
+
+def showUsage():
+
+        sys.stderr.write('usage: %s [-P priority[,priority...]] [-O mouse|human|rat|other[,...]] [markerkey]\n' % sys.argv[0])
+        sys.exit(1)
 
 #
 # Main Routine
@@ -571,29 +748,99 @@ print('%s' % mgi_utils.date())
 db.useOneConnection(1)
 #db.set_sqlLogFunction(db.sqlLogAll)
 
-if len(sys.argv) == 2:
-        markerKey = sys.argv[1]
-else:
+try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'P:O:')
+except:
+        showUsage()
+
+priorities = None
+
+for opt in optlist:
+        if opt[0] == '-P':
+                for p in str.split(opt[1], ','):
+                        if not p.isdigit() or int(p) < 1 or int(p) > 14:
+                                showUsage()
+                        priorities = (priorities or []) + [int(p)]
+        elif opt[0] == '-O':
+                for organism in str.split(opt[1], ','):
+                        if organism not in organismPriorities:
+                                showUsage()
+                        priorities = (priorities or []) + organismPriorities[organism]
+
+if len(args) == 1:
+        markerKey = args[0]
+elif len(args) == 0:
         markerKey = None
+else:
+        showUsage()
+
+if priorities is not None:
+        # see MRKCACHELABELDEDUP above
+        if dedup:
+                sys.stderr.write('MRKCACHELABELDEDUP=1 cannot be used with -P/-O\n')
+                sys.exit(1)
+        priorities = sorted(set(priorities))
+        groups = selectGroups(priorities)
+
+# Alliance direct homology, for priorities 8, 9 and 11-14
+graph = mrkortholog.directGraph()
+
+if markerKey is None and priorities is None:
+        outBCP = mrkcachelib.openOutput(table, outDir)
+        firstKey = 1
+else:
+        # only some of the rows are selected, and they replace the
+        # same rows in MRK_Label directly; the other rows keep their keys
+
+        scope = []
+
+        if markerKey is not None:
+                # the marker and its orthologs: the queries are restricted to them
+
+                scopeKeys = [int(markerKey)]
+                for pair in graph.pairs(1, (1,), exclude = 1, markerKey = markerKey):
+                        scopeKeys.append(pair[1])
+                markerScope = '(%s)' % (str.join(',', [str(k) for k in sorted(set(scopeKeys))]))
+                scope.append('_Marker_key in %s' % (markerScope))
+
+                print('processing marker and orthologs %s...%s' % (markerScope, mgi_utils.date()))
+
+        if priorities is not None:
+                scope.append('priority in (%s)' % (str.join(',', [str(p) for p in priorities])))
+
+                print('processing priorities %s...%s' % (str.join(',', [str(p) for p in priorities]), mgi_utils.date()))
+
+        db.sql('lock table %s in exclusive mode' % (table), None)
+        db.sql('delete from %s where %s' % (table, str.join(' and ', scope)), None)
 
-outBCP = open(outDir + '/%s.bcp' % (table), 'w')
-
-priority1()
-priority2()
-priority3()
-priority4()
-priority5()
-priority6()
-priority7()
-priority8()
-priority9()
-priority10()
-priority11()
-priority12()
-priority13()
-priority14()
+        results = db.sql('select coalesce(max(_Label_key), 0) + 1 as firstKey from %s' % (table), 'auto')
+        firstKey = results[0]['firstKey']
 
+        outBCP = mrkcachelib.InsertWriter(table)
+
+if len([g for g in groups if g[0] in orthologySteps]) > 0:
+        partitionOrthology()
+
+print('running %d priority groups on %d workers...%s' % (len(groups), workers, mgi_utils.date()))
+
+with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(runWorker, g) for g in range(len(groups))]
+
+try:
+        for f in futures:
+                f.result()
+except:
+        outBCP.abort()
+        removeShards()
+        raise
+
+mergeShards(firstKey)
 outBCP.close()
+
+if markerKey is not None or priorities is not None:
+        db.commit()
+        print('replaced (%d) records...%s' % (outBCP.count, mgi_utils.date()))
+
 db.useOneConnection(0)
 
 print('%s' % mgi_utils.date())
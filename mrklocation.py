@@ -8,12 +8,29 @@
 # Uses environment variables to determine Server and Database
 #
 # Usage:
-#	mrklocation.py [markerkey]
+#	mrklocation.py [markerkey[,markerkey...] ...]
+#	mrklocation.py -C collection
 #
-# If markerkey is provided, then only create the bcp file for that marker.
+# If markerkeys are provided, then only the rows of those markers are
+# replaced: they are deleted from MRK_Location_Cache and re-inserted in
+# batched multi-row inserts, all in one transaction, so a reader never
+# sees a marker without its location.
+#
+# -C refreshes the markers whose coordinates come from one coordinate
+# collection (MAP_Coord_Collection abbreviation or _Collection_key), as
+# after that collection's coordinate load: the markers with a coordinate
+# of the collection, directly or through their representative sequence,
+# and the markers whose cache rows came from it.  They are then replaced
+# as for a list of markerkeys.
 #
 # Processing:
 #
+# The markers and their coordinates are read with one query, in
+# _Marker_key order (see process()).
+#
+# When MRKCACHEINTERVALINDEX is set, a full load also writes a genomic
+# interval index of the coordinates (see mrkinterval.py).
+#
 # History
 #
 # 08/03/2012	jsb
@@ -37,8 +54,11 @@
 
 import sys
 import os
+import getopt
 import mgi_utils
 import db
+import mrkcachelib
+import mrkinterval
 
 try:
     COLDL = os.environ['COLDELIM']
@@ -46,27 +66,89 @@ try:
     table = os.environ['TABLE']
     outDir = os.environ['MRKCACHEBCPDIR']
 except:
+    # run from EI without the load's environment
+    COLDL = mrkcachelib.COLDL
+    LINEDL = '\n'
     table = 'MRK_Location_Cache'
 
+try:
+    intervalIndex = os.environ['MRKCACHEINTERVALINDEX'] == '1'
+except:
+    intervalIndex = 0
+
 cdate = mgi_utils.date("%m/%d/%Y")
 createdBy = '1000'
 
-def process(markerKey):
+def collectionMarkers(collection):
+        #
+        # Purpose: finds the markers whose coordinates come from a collection
+        # Returns: list of marker keys (strings)
+        # Assumes:
+        # Effects:
+        # Throws:
+        #
+        # collection : MAP_Coord_Collection abbreviation or _Collection_key
+        #
+
+        if collection.isdigit():
+                collectionWhere = 'c._Collection_key = %s' % (collection)
+        else:
+                collectionWhere = "c.abbreviation = '%s'" % (collection.replace("'", "''"))
+
+        results = db.sql('select c._Collection_key, c.abbreviation from MAP_Coord_Collection c where %s' \
+                % (collectionWhere), 'auto')
+
+        if len(results) == 0:
+                sys.stderr.write('unknown coordinate collection: %s\n' % (collection))
+                sys.exit(1)
+
+        collectionKey = results[0]['_Collection_key']
+        provider = results[0]['abbreviation']
+        print('Processing by collection: %s (%s)' % (provider, collectionKey))
+
+        results = db.sql('''select f._Object_key as _Marker_key
+                from MAP_Coordinate cc, MAP_Coord_Feature f
+                where cc._Collection_key = %s
+                and cc._Map_key = f._Map_key
+                and f._MGIType_key = 2
+                union
+                select mc._Marker_key
+                from MAP_Coordinate cc, MAP_Coord_Feature f, SEQ_Marker_Cache mc
+                where cc._Collection_key = %s
+                and cc._Map_key = f._Map_key
+                and f._MGIType_key = 19
+                and f._Object_key = mc._Sequence_key
+                and mc._Qualifier_key = 615419
+                union
+                select _Marker_key
+                from MRK_Location_Cache
+                where provider = '%s'
+                order by 1
+                ''' % (collectionKey, collectionKey, provider.replace("'", "''")), 'auto')
+
+        return [str(r['_Marker_key']) for r in results]
+
+def process(markerKeys):
         '''
         #
         # MRK_Location_Cache is a cache table of marker location data
         #
+        # markerKeys : None for all markers, else a list of marker keys
+        #	whose rows are deleted and re-inserted in one transaction
+        #
         '''
 #		where m._Organism_key = 1
 #		and m._Marker_key = o._Marker_key
 
-        if (markerKey == None):
+        if (markerKeys == None):
                 print('Processing by bcp:  %s.bcp...' % (table))
-                locBCP = open(outDir + '/%s.bcp' % (table), 'w')
+                locBCP = mrkcachelib.openOutput(table, outDir)
+                if intervalIndex:
+                        intervals = mrkinterval.IntervalWriter('%s/%s.intervals' % (outDir, table))
         else:
-                print('Processing by marker key: %s' %(markerKey))
-                db.sql('delete from MRK_Location_Cache where _Marker_key = %s' % (markerKey))
-                db.commit()
+                markerIn = '(%s)' % (','.join(markerKeys))
+                print('Processing by marker key: %s' % (','.join(markerKeys)))
+                locBCP = mrkcachelib.InsertWriter(table)
 
         # the chromosome retrieved from the marker table is the genetic
         # chromosome, and goes in the traditional 'chromosome' field in the
@@ -82,58 +164,54 @@ def process(markerKey):
                 where m._Organism_key in (1,2) and m._Marker_Status_key in (1,2)
                 '''
 
-        if (markerKey != None):
-                cmd = cmd + " and m._Marker_key = " + markerKey
+        if (markerKeys != None):
+                cmd = cmd + " and m._Marker_key in " + markerIn
 
         db.sql(cmd, None)
 
         db.sql('create index idx1 on markers(_Marker_key)', None)
 
         #
-        # the coordinate lookup should contain only one marker coordinate.
+        # the coordinates of each marker, with the marker's row.
         #
         # see TR10207 for more information
         #
-        # 1) add to the lookup all coordinates that do not contain a sequence
-        # 2) add to the lookup all coordinates that do contain a sequence,
-        #    but are not already in the lookup
+        # 1) a marker's own coordinates (MAP_Coord_Feature), of which there
+        #    may be several (ex. microRNAs)
+        # 2) only for a marker with none of its own: one coordinate of its
+        #    representative sequence
+        #
+        # A marker with neither gets one row with no coordinate.
+        #
+        # The rows are read in _Marker_key order through a server-side
+        # cursor, so no per-marker coordinate lookup is held in memory.
+        # A marker's coordinates are ordered too, so that the rows (and
+        # their digest) are the same from run to run.
         #
         # The chromosome retrieved with coordinates is the genomic chromosome,
         # and goes in the 'genomicChromosome' field in the cache table.  Most
         # often, it agrees with the genetic chromosome, but not always.
-
-        coord = {}
-
-        #
-        # coordinates for Marker w/out Sequence coordinates
         #
 
-        results = db.sql('''select m._Marker_key, f.startCoordinate, f.endCoordinate, f.strand, 
-                u.term as mapUnits, c.abbreviation as provider, cc.version, chrom.chromosome as genomicChromosome 
-                from markers m, MAP_Coord_Collection c, MAP_Coordinate cc, MAP_Coord_Feature f, VOC_Term u, MRK_Chromosome chrom 
-                where m._Marker_key = f._Object_key 
-                and f._MGIType_key = 2 
-                and f._Map_key = cc._Map_key 
-                and cc._Collection_key = c._Collection_key 
-                and cc._Object_key = chrom._Chromosome_key 
+        cmd = '''with featureCoord as (
+                select m._Marker_key, f.startCoordinate, f.endCoordinate, f.strand,
+                    u.term as mapUnits, c.abbreviation as provider, cc.version,
+                    chrom.chromosome as genomicChromosome
+                from markers m, MAP_Coord_Collection c, MAP_Coordinate cc, MAP_Coord_Feature f,
+                    VOC_Term u, MRK_Chromosome chrom
+                where m._Marker_key = f._Object_key
+                and f._MGIType_key = 2
+                and f._Map_key = cc._Map_key
+                and cc._Collection_key = c._Collection_key
+                and cc._Object_key = chrom._Chromosome_key
                 and cc._Units_key = u._Term_key
-                ''', 'auto')
-        for r in results:
-            key = r['_Marker_key']
-            value = r
-
-            if key not in coord:
-                coord[key] = []
-            coord[key].append(r)
-
-        #
-        # coordinates for Markers w/ Sequence coordinates
-        #
-
-        results = db.sql('''select m.symbol, m._Marker_key, c.startCoordinate, 
-                c.endCoordinate, c.strand, c.mapUnits, mcc.abbreviation as provider, c.version, c.chromosome as genomicChromosome
-                from markers m, SEQ_Marker_Cache mc, SEQ_Coord_Cache c, 
-                    MAP_Coord_Feature mcf, MAP_Coordinate map, MAP_Coord_Collection mcc, MRK_Marker mm
+                ),
+                sequenceCoord as (
+                select distinct on (m._Marker_key) m._Marker_key, c.startCoordinate,
+                    c.endCoordinate, c.strand, c.mapUnits, mcc.abbreviation as provider,
+                    c.version, c.chromosome as genomicChromosome
+                from markers m, SEQ_Marker_Cache mc, SEQ_Coord_Cache c,
+                    MAP_Coord_Feature mcf, MAP_Coordinate map, MAP_Coord_Collection mcc
                 where m._Marker_key = mc._Marker_key
                 and mc._Qualifier_key = 615419
                 and mc._Sequence_key = c._Sequence_key
@@ -141,117 +219,83 @@ def process(markerKey):
                 and mcf._MGIType_key = 19
                 and mcf._Map_key = map._Map_key
                 and map._Collection_key = mcc._Collection_key
-                and m._Marker_key = mm._Marker_key''', 'auto')
-        for r in results:
-            key = r['_Marker_key']
-            value = r
+                and not exists (select 1 from featureCoord fc where fc._Marker_key = m._Marker_key)
+                order by m._Marker_key, c._Sequence_key
+                )
+                select m.*, c.startCoordinate, c.endCoordinate, c.strand, c.mapUnits,
+                    c.provider, c.version, c.genomicChromosome
+                from markers m
+                    LEFT OUTER JOIN (
+                        select * from featureCoord
+                        union all
+                        select * from sequenceCoord
+                        ) c on (m._Marker_key = c._Marker_key)
+                order by m._Marker_key, c.provider, c.startCoordinate, c.endCoordinate,
+                    c.genomicChromosome, c.strand, c.version
+                '''
 
-            # only one coordinate per marker
-            if key not in coord:
-                coord[key] = []
-                coord[key].append(r)
-            #else:
-        #	print key, value
+        # the markers' rows are replaced under a table lock, so that two
+        # refreshes of the same marker cannot both insert its rows
+
+        if (markerKeys != None):
+                db.sql('lock table %s in exclusive mode' % (table), None)
+                db.sql('delete from %s where _Marker_key in %s' % (table, markerIn), None)
 
         nextMaxKey = 0
+        prevKey = None
 
-        results = db.sql('select * from markers order by _Marker_key', 'auto')
+        results = mrkcachelib.streamSql(cmd)
         for r in results:
 
             key = r['_Marker_key']
             symbol = r['symbol']
             chr = r['chromosome']
 
-            if chr == 'UN' and key in coord:
-                print('Marker has UN chromosome and a coordinate:  ' + symbol)
+            # one record per coordinate; the first for each marker
 
-            # print one record out per coordinate
+            if key != prevKey:
+                prevKey = key
+                nextMaxKey = nextMaxKey + 1
 
-            nextMaxKey = nextMaxKey + 1
+                if chr == 'UN' and r['startCoordinate'] != None:
+                    print('Marker has UN chromosome and a coordinate:  ' + symbol)
 
             try:
                 cytogeneticOffset = r['cytogeneticOffset'].replace('|', ',')
             except:
                 cytogeneticOffset = ''
 
-            if key in coord:
-                for c in coord[key]:
-                    if (markerKey == None):
-                        locBCP.write(mgi_utils.prvalue(r['_Marker_key']) + COLDL + \
-                                mgi_utils.prvalue(r['_Marker_Type_key']) + COLDL + \
-                                mgi_utils.prvalue(r['_Organism_key']) + COLDL + \
-                                chr + COLDL + \
-                                mgi_utils.prvalue(r['sequenceNum']) + COLDL + \
-                                mgi_utils.prvalue(cytogeneticOffset) + COLDL + \
-                                mgi_utils.prvalue(r['cmoffset']) + COLDL + \
-                                mgi_utils.prvalue(c['genomicChromosome']) + COLDL + \
-                                mgi_utils.prvalue(c['startCoordinate']) + COLDL + \
-                                mgi_utils.prvalue(c['endCoordinate']) + COLDL + \
-                                mgi_utils.prvalue(c['strand']) + COLDL + \
-                                mgi_utils.prvalue(c['mapUnits']) + COLDL + \
-                                mgi_utils.prvalue(c['provider']) + COLDL + \
-                                mgi_utils.prvalue(c['version']) + COLDL + \
-                                createdBy + COLDL + \
-                                createdBy + COLDL + \
-                                cdate + COLDL + \
-                                cdate + LINEDL)
-                    else:
-                        db.sql('''insert into MRK_Location_Cache values(%s,%s,%s,'%s',%s,'%s','%s','%s','%s','%s','%s','%s','%s','%s',%s,%s,now(),now())
-                                ''' % (markerKey,
-                                r['_Marker_Type_key'],
-                                r['_Organism_key'],
-                                chr,
-                                r['sequenceNum'],
-                                cytogeneticOffset,
-                                r['cmoffset'],
-                                c['genomicChromosome'],
-                                c['startCoordinate'],
-                                c['endCoordinate'],
-                                c['strand'],
-                                c['mapUnits'],
-                                c['provider'],
-                                c['version'],
-                                createdBy,
-                                createdBy))
-                        db.commit()
-            else:
-                if (markerKey == None):
-                    locBCP.write(mgi_utils.prvalue(r['_Marker_key']) + COLDL + \
-                             mgi_utils.prvalue(r['_Marker_Type_key']) + COLDL + \
-                             mgi_utils.prvalue(r['_Organism_key']) + COLDL + \
-                             chr + COLDL + \
-                             mgi_utils.prvalue(r['sequenceNum']) + COLDL + \
-                             mgi_utils.prvalue(cytogeneticOffset) + COLDL + \
-                             mgi_utils.prvalue(r['cmoffset']) + COLDL + \
-                             COLDL + \
-                             COLDL + \
-                             COLDL + \
-                             COLDL + \
-                             COLDL + \
-                             COLDL + \
-                             COLDL + \
-                             createdBy + COLDL + \
-                             createdBy + COLDL + \
-                             cdate + COLDL + \
-                             cdate + LINEDL)
-                else:
-                        db.sql('''insert into MRK_Location_Cache values(%s,%s,%s,'%s',%s,'%s','%s',null,null,null,null,null,null,null,%s,%s,now(),now())
-                                ''' % (markerKey,
-                                r['_Marker_Type_key'],
-                                r['_Organism_key'],
-                                chr,
-                                r['sequenceNum'],
-                                cytogeneticOffset,
-                                r['cmoffset'],
-                                createdBy,
-                                createdBy))
-                        db.commit()
-
-            if (markerKey == None):
-                locBCP.flush()
-
-        if (markerKey == None):
-            locBCP.close()
+            locBCP.write(mgi_utils.prvalue(r['_Marker_key']) + COLDL + \
+                    mgi_utils.prvalue(r['_Marker_Type_key']) + COLDL + \
+                    mgi_utils.prvalue(r['_Organism_key']) + COLDL + \
+                    chr + COLDL + \
+                    mgi_utils.prvalue(r['sequenceNum']) + COLDL + \
+                    mgi_utils.prvalue(cytogeneticOffset) + COLDL + \
+                    mgi_utils.prvalue(r['cmoffset']) + COLDL + \
+                    mgi_utils.prvalue(r['genomicChromosome']) + COLDL + \
+                    mgi_utils.prvalue(r['startCoordinate']) + COLDL + \
+                    mgi_utils.prvalue(r['endCoordinate']) + COLDL + \
+                    mgi_utils.prvalue(r['strand']) + COLDL + \
+                    mgi_utils.prvalue(r['mapUnits']) + COLDL + \
+                    mgi_utils.prvalue(r['provider']) + COLDL + \
+                    mgi_utils.prvalue(r['version']) + COLDL + \
+                    createdBy + COLDL + \
+                    createdBy + COLDL + \
+                    cdate + COLDL + \
+                    cdate + LINEDL)
+
+            if (markerKeys == None and intervalIndex):
+                intervals.add(r['genomicChromosome'], r['startCoordinate'], r['endCoordinate'], key)
+
+        locBCP.close()
+
+        if (markerKeys == None and intervalIndex):
+            intervals.close()
+
+        # the delete and the inserts are one transaction
+        if (markerKeys != None):
+            db.commit()
+            print('Inserted %d rows' % (locBCP.count))
 
 #
 # Main Routine
@@ -259,13 +303,35 @@ def process(markerKey):
 
 print('%s' % mgi_utils.date())
 
-if len(sys.argv) == 2:
-        markerKey = sys.argv[1]
+try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'C:')
+except:
+        sys.stderr.write('usage: %s [-C collection | markerkey[,markerkey...] ...]\n' % sys.argv[0])
+        sys.exit(1)
+
+collection = None
+
+for opt in optlist:
+        if opt[0] == '-C':
+                collection = opt[1]
+
+if len(args) > 0:
+        markerKeys = []
+        for arg in args:
+                markerKeys = markerKeys + [str(int(k)) for k in arg.split(',')]
 else:
-        markerKey = None
+        markerKeys = None
 
 db.useOneConnection(1)
-process(markerKey)
+
+if collection != None:
+        markerKeys = collectionMarkers(collection)
+
+if markerKeys == []:
+        print('No markers to process')
+else:
+        process(markerKeys)
+
 db.useOneConnection(0)
 
 print('%s' % mgi_utils.date())
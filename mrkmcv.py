@@ -24,6 +24,7 @@ import os
 import getopt
 import mgi_utils
 import db
+import mrkcachelib
 
 try:
         COLDELIM = os.environ['COLDELIM']
@@ -473,14 +474,14 @@ def createBCPfile():
     mcvBCP = '%s/%s.bcp' % (outDir, table)
 
     #print('Creating %s and %s ...' % (mcvBCP, curatorLog))
-    mcvFp = open(mcvBCP, 'w')
+    mcvFp = mrkcachelib.openOutput(table, outDir)
     rptFp = open(curatorLog, 'w')
 
     # get all official mouse markers
-    results = db.sql('''select _Marker_key, _Marker_Type_key
+    results = mrkcachelib.streamSql('''select _Marker_key, _Marker_Type_key
             from MRK_Marker
             where _Organism_key = 1
-            and _Marker_Status_key = 1''', 'auto')
+            and _Marker_Status_key = 1''')
     for r in results:
         mkrKey = r['_Marker_key']
         mTypeKey = r['_Marker_Type_key']
@@ -501,6 +502,7 @@ def createBCPfile():
                 directTermList.append(term)
             else:
                 print('term does not exist for mcvKey %s' % mcvKey)
+                mcvFp.abort()
                 sys.exit(1)
 
         # annotations already made so we don't create dups
@@ -520,7 +522,7 @@ def createBCPfile():
                 # on mrk_mcv_cache is _Marker_key, _mcvterm_key
                 if ancKey in annotateToList:
                     print('Load FAILED, no database reload required, contact curator (see wiki): MarkerKey %s has both direct and indirect annotations to mcvKey %s' % (mkrKey, ancKey))
-                    mcvFp.close()
+                    mcvFp.abort()
                     sys.exit(1)
                 if ancKey not in annotMadeList:
                     annotMadeList.append(ancKey)
@@ -21,6 +21,7 @@ import sys
 import os
 import mgi_utils
 import db
+import mrkcachelib
 
 try:
         table = os.environ['COUNT_TABLE']
@@ -43,19 +44,19 @@ def createBCPfile():
     #
     '''
     print('Creating %s ...' % countBCP)
-    countFp = open(countBCP, 'w')
+    countFp = mrkcachelib.openOutput(table, outDir)
     db.sql('''select distinct _MCVTerm_key, count(_MCVTerm_key) as mkrCt
         INTO TEMPORARY TABLE mkrCt
         from MRK_MCV_Cache
         group by _MCVTerm_key''', None)
     # must be distinct or dups will be returned where there are both
     # SO and MCV ids associated with a term
-    results = db.sql('''select distinct v.term, m.*
+    results = mrkcachelib.streamSql('''select distinct v.term, m.*
         from VOC_Term v, ACC_Accession a, mkrCt m
         where m._MCVTerm_key = v._Term_key
         and v._Term_key = a._Object_key
         and a._MGIType_key = 13
-        and a.preferred = 1''', 'auto')
+        and a.preferred = 1''')
     for r in results:
         termKey = r['_MCVTerm_key']
         markerCt = r['mkrCt']
@@ -0,0 +1,294 @@
+'''
+#
+# Purpose:
+#
+# The Alliance homology clusters (MRK_Cluster/MRK_ClusterMember), held in
+# memory, for the loads that need the orthologs of a marker:
+#
+#	mrkdo.py    : Alliance clustered homology (clusteredGraph())
+#	mrklabel.py : Alliance direct homology (directGraph())
+#
+# The cluster membership of one homology source is read with one query
+# and kept in integer arrays:
+#
+#	clusterOffsets/members/organisms : the members of each cluster, and
+#		the organism of each member
+#	markers/markerOrganisms/markerOffsets/markerClusters : the
+#		organism and the clusters of each marker, markers sorted so
+#		that a marker is found by bisection
+#
+# membersOf() then answers "the markers of organism Y in the clusters of
+# marker X" without going back to the database.
+#
+# When MRKCACHESNAPSHOT is set, the arrays are also saved to
+# ${MRKCACHEBCPDIR}/ortholog.<source>.snapshot.  A later load uses the
+# snapshot instead of reading the clusters again, as long as the source's
+# MRK_Cluster rows, MRK_ClusterMember and MRK_Marker look the same as when
+# it was saved (see signature()); so a single-marker run does not pay for
+# reading every cluster.
+#
+# History
+#
+'''
+
+import os
+import pickle
+import bisect
+from array import array
+import db
+import mrkcachelib
+
+directSourceKey = 75885739	# Alliance direct homology
+clusteredSourceKey = 75885740	# Alliance clustered homology
+homologyTypeKey = 9272150	# cluster type 'homology'
+
+try:
+    snapshotDir = os.environ['MRKCACHEBCPDIR']
+    useSnapshot = os.environ['MRKCACHESNAPSHOT'] == '1'
+except:
+    snapshotDir = None
+    useSnapshot = 0
+
+# the arrays saved in a snapshot
+arrays = ('clusterOffsets', 'members', 'organisms', 'markers', 'markerOrganisms', 'markerOffsets', 'markerClusters')
+
+class OrthologGraph:
+        #
+        # Purpose: the clusters of one homology source
+        #
+
+        def __init__(self, sourceKey, clusterTypeKey = None):
+            self.sourceKey = sourceKey
+            self.clusterTypeKey = clusterTypeKey
+            self.clusterOffsets = array('l', [0])
+            self.members = array('l')
+            self.organisms = array('l')
+            self.markers = array('l')
+            self.markerOrganisms = array('l')
+            self.markerOffsets = array('l', [0])
+            self.markerClusters = array('l')
+
+        def signature(self):
+            #
+            # Purpose: identifies the current contents of the source's clusters
+            # Returns: tuple
+            #
+            # The source's clusters (count, max key, last modification
+            # date), MRK_ClusterMember (count, max key) and MRK_Marker
+            # (last modification date): aggregates of each table on its
+            # own, much cheaper than the join read() does, that change
+            # when a cluster or member is added or removed, or a marker
+            # (its organism) is modified.
+            #
+
+            cmd = '''select count(*) as clusters, max(_Cluster_key) as maxKey,
+                    max(modification_date) as modDate
+                from MRK_Cluster
+                where _ClusterSource_key = %s
+                ''' % (self.sourceKey)
+
+            if self.clusterTypeKey is not None:
+                cmd = cmd + 'and _ClusterType_key = %s\n' % (self.clusterTypeKey)
+
+            c = db.sql(cmd, 'auto')[0]
+
+            cm = db.sql('''select count(*) as members, max(_ClusterMember_key) as maxKey
+                from MRK_ClusterMember
+                ''', 'auto')[0]
+
+            m = db.sql('select max(modification_date) as modDate from MRK_Marker', 'auto')[0]
+
+            return (c['clusters'], c['maxKey'], str(c['modDate']),
+                    cm['members'], cm['maxKey'], str(m['modDate']))
+
+        def read(self):
+            #
+            # Purpose: reads the source's clusters from the database
+            # Effects: fills in the arrays
+            #
+
+            cmd = '''select cm._Cluster_key, cm._Marker_key, m._Organism_key
+                from MRK_Cluster c, MRK_ClusterMember cm, MRK_Marker m
+                where c._ClusterSource_key = %s
+                and c._Cluster_key = cm._Cluster_key
+                and cm._Marker_key = m._Marker_key
+                ''' % (self.sourceKey)
+
+            if self.clusterTypeKey is not None:
+                cmd = cmd + 'and c._ClusterType_key = %s\n' % (self.clusterTypeKey)
+
+            cmd = cmd + 'order by cm._Cluster_key, cm._Marker_key'
+
+            markerClusters = {}	# marker key : list of cluster indexes
+            markerOrganisms = {}	# marker key : organism key
+            clusterKey = None
+
+            for r in mrkcachelib.streamSql(cmd):
+                if r['_Cluster_key'] != clusterKey:
+                    if clusterKey is not None:
+                        self.clusterOffsets.append(len(self.members))
+                    clusterKey = r['_Cluster_key']
+
+                cluster = len(self.clusterOffsets) - 1
+                marker = r['_Marker_key']
+                self.members.append(marker)
+                self.organisms.append(r['_Organism_key'])
+                markerClusters.setdefault(marker, []).append(cluster)
+                markerOrganisms[marker] = r['_Organism_key']
+
+            if clusterKey is not None:
+                self.clusterOffsets.append(len(self.members))
+
+            for marker in sorted(markerClusters):
+                self.markers.append(marker)
+                self.markerOrganisms.append(markerOrganisms[marker])
+                self.markerClusters.extend(markerClusters[marker])
+                self.markerOffsets.append(len(self.markerClusters))
+
+        def index(self, markerKey):
+            #
+            # Purpose: finds a marker
+            # Returns: the marker's index in markers; None if it is in no cluster
+            #
+
+            i = bisect.bisect_left(self.markers, markerKey)
+            if i == len(self.markers) or self.markers[i] != markerKey:
+                return None
+            return i
+
+        def membersOf(self, markerKey, organismKeys = None, exclude = 0):
+            #
+            # Purpose: the markers in the clusters of markerKey
+            # Returns: sorted list of (marker key, organism key), including
+            #          markerKey itself if its organism is selected
+            #
+            # organismKeys : only members of these organisms (or, if exclude,
+            #                of any other organism); None for all members
+            #
+
+            i = self.index(markerKey)
+            if i is None:
+                return []
+
+            found = set()
+
+            for c in self.markerClusters[self.markerOffsets[i]:self.markerOffsets[i + 1]]:
+                for j in range(self.clusterOffsets[c], self.clusterOffsets[c + 1]):
+                    organism = self.organisms[j]
+                    if organismKeys is None or (organism in organismKeys) != bool(exclude):
+                        found.add((self.members[j], organism))
+
+            return sorted(found)
+
+        def markersOf(self, organismKey):
+            #
+            # Purpose: the markers of one organism that are in a cluster
+            # Returns: generator of marker keys, in key order
+            #
+
+            for i in range(len(self.markers)):
+                if self.markerOrganisms[i] == organismKey:
+                    yield self.markers[i]
+
+        def pairs(self, organismKey, orthologOrganismKeys, exclude = 0, markerKey = None):
+            #
+            # Purpose: the orthologs of every marker of one organism
+            # Returns: generator of (marker key, ortholog key, organism key,
+            #          ortholog organism key)
+            #
+            # markerKey : only the orthologs of this marker
+            #
+
+            if markerKey is None:
+                markers = self.markersOf(organismKey)
+            else:
+                i = self.index(int(markerKey))
+                if i is not None and self.markerOrganisms[i] == organismKey:
+                    markers = [self.markers[i]]
+                else:
+                    markers = []
+
+            for marker in markers:
+                for ortholog, orthologOrganism in self.membersOf(marker, orthologOrganismKeys, exclude):
+                    if ortholog != marker:
+                        yield marker, ortholog, organismKey, orthologOrganism
+
+        def snapshotPath(self):
+            return '%s/ortholog.%s.snapshot' % (snapshotDir, self.sourceKey)
+
+        def loadSnapshot(self, signature):
+            #
+            # Purpose: fills in the arrays from the snapshot
+            # Returns: 1 if the snapshot exists and matches signature, else 0
+            #
+
+            try:
+                fp = open(self.snapshotPath(), 'rb')
+                saved = pickle.load(fp)
+                fp.close()
+            except:
+                return 0
+
+            if saved['signature'] != signature or saved['clusterTypeKey'] != self.clusterTypeKey:
+                return 0
+
+            for name in arrays:
+                setattr(self, name, saved[name])
+
+            return 1
+
+        def saveSnapshot(self, signature):
+            #
+            # Purpose: saves the arrays for later loads
+            #
+
+            saved = {'signature' : signature, 'clusterTypeKey' : self.clusterTypeKey}
+            for name in arrays:
+                saved[name] = getattr(self, name)
+
+            path = self.snapshotPath()
+            fp = open(path + '.tmp', 'wb')
+            pickle.dump(saved, fp, pickle.HIGHEST_PROTOCOL)
+            fp.close()
+            os.rename(path + '.tmp', path)
+
+def load(sourceKey, clusterTypeKey = None):
+        #
+        # Purpose: loads the clusters of one homology source
+        # Returns: OrthologGraph
+        # Assumes: the load's db login has been set
+        # Effects: may read/write the source's snapshot (see MRKCACHESNAPSHOT)
+        # Throws:
+        #
+
+        graph = OrthologGraph(sourceKey, clusterTypeKey)
+
+        if not useSnapshot:
+            graph.read()
+            return graph
+
+        signature = graph.signature()
+
+        if graph.loadSnapshot(signature):
+            print('read ortholog snapshot %s' % (graph.snapshotPath()))
+            return graph
+
+        graph.read()
+        graph.saveSnapshot(signature)
+        return graph
+
+def directGraph():
+        #
+        # Purpose: loads the Alliance direct homology clusters
+        # Returns: OrthologGraph
+        #
+
+        return load(directSourceKey)
+
+def clusteredGraph():
+        #
+        # Purpose: loads the Alliance clustered homology clusters
+        # Returns: OrthologGraph
+        #
+
+        return load(clusteredSourceKey, homologyTypeKey)
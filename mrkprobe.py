@@ -20,6 +20,7 @@ import sys
 import os
 import mgi_utils
 import db
+import mrkcachelib
 
 try:
     COLDL = os.environ['COLDELIM']
@@ -152,7 +153,7 @@ def createBCPfile():
         results = db.sql('''select nextval('prb_marker_seq') as maxKey''', 'auto')
         assocKey = results[0]['maxKey']
 
-        results = db.sql('select distinct _Probe_key, _Marker_key from createautoe', 'auto')
+        results = mrkcachelib.streamSql('select distinct _Probe_key, _Marker_key from createautoe')
         for r in results:
             bcpFile.write(str(assocKey) + COLDL + \
                 mgi_utils.prvalue(r['_Probe_key']) + COLDL + \
@@ -8,9 +8,25 @@
 # Uses environment variables to determine Server and Database
 #
 # Usage:
-#	mrkref.py [markerkey]
+#	mrkref.py [-s source]
+#	mrkrefByMarker.py [markerkey[,markerkey...] ...]
+#	mrkrefByReference.py [refskey[,refskey...] ...]
 #
-# If markerkey is provided, then only create the bcp file for that marker.
+# mrkref.py creates the bcp file for all markers.
+#
+# mrkrefByMarker.py/mrkrefByReference.py refresh the MRK_Reference rows
+# of the given markers/references; with no keys (or '-') the keys are
+# read from stdin, one or more per line.  The pairs of the whole key set
+# are selected once; the old rows are deleted and the new rows inserted
+# in batched multi-row inserts, all in one transaction.
+#
+# When MRKCACHESNAPSHOT is set, mrkref.py also saves the pairs of each
+# source (see sources) to ${MRKCACHEBCPDIR}/MRK_Reference.<source>.snapshot;
+# it writes them as <...>.snapshot.pending, which mrkcacheapply.csh
+# renames once the rows are in MRK_Reference.
+# After the load of one source (ex. the GO load), 'mrkref.py -s go'
+# selects that source's pairs again and inserts/deletes only the pairs
+# that entered or left the union (see processBySource()).
 #
 # IMPORTANT:  Keep in synch with stored procedure MRK_reloadReference.
 #
@@ -89,8 +105,11 @@
 
 import sys
 import os
+import getopt
+from array import array
 import mgi_utils
 import db
+import mrkcachelib
 
 try:
     COLDL = os.environ['COLDELIM']
@@ -99,132 +118,62 @@ try:
     outDir = os.environ['MRKCACHEBCPDIR']
 
 except:
-    #COLDL = os.environ['COLDELIM']
-    #LINEDL = '\n'
+    # run from EI without the load's environment
+    COLDL = mrkcachelib.COLDL
+    LINEDL = '\n'
     table = 'MRK_Reference'
 
-cdate = mgi_utils.date("%m/%d/%Y")
-
-def processAll():
-        global refBCP
-        print('Creating %s.bcp...' % (table))
-        refBCP = open(outDir + '/%s.bcp' % (table), 'w')
-        process(None, None, None, None)
-        refBCP.close()
-        db.commit()
-
-def processByMarker(markerKey):
-        print('Processed by marker: ' + markerKey)
-        db.sql('delete from MRK_Reference where _Marker_key = %s' % (markerKey))
-        db.commit()
-        process(markerKey, ' where _Marker_key = ' + markerKey, ' and _Marker_key = ' + markerKey, ' and _Object_key = ' + markerKey)
-        db.commit()
+try:
+    useSnapshot = os.environ['MRKCACHESNAPSHOT'] == '1'
+except:
+    useSnapshot = 0
 
-def processByReference(refsKey):
-        print('Processed by reference: ' + refsKey)
-        db.sql('delete from MRK_Reference where _Refs_key = %s' % (refsKey))
-        db.commit()
-        process(refsKey, ' where _Refs_key = ' + refsKey, ' and r._Refs_key = ' + refsKey, ' and _Refs_key = ' + refsKey)
-        db.commit()
+cdate = mgi_utils.date("%m/%d/%Y")
 
-def process(queryKey, queryWhere, queryAnd, queryAnd2):
-        '''
-        #
-        # Create a cache table of
-        # the union of all distinct Marker/Reference pairs
-        # in the database + annotated Reference (MGI_Reference_Assoc)
-        # EXCEPT for MLC.
-        #
-        # Datasets:
-        #
-        # 1.  Molecular Segments
-        # 2.  Orthology
-        # 3.  Marker History
-        # 4.  Mapping
-        # 5.  GXD Index
-        # 6.  GXD Assay
-        # 7.  Synonyms
-        # 8.  Accession Reference
-        # 9.  Allele References
-        # 10. GO Annotations
-        # 11. Manually curated (MGI_Reference_Assoc)
-        #
-        '''
+#
+# The sources of the Marker/Reference pairs:
+#
+#	(name, temp table, query, which of process()'s filters applies)
+#
+# The filter is appended to the query when only some markers/references
+# are processed: 'where' (queryWhere), 'and' (queryAnd) or 'and2'
+# (queryAnd2).
+#
 
-        #
+sources = [
         # Probe/Marker
-        #
+        ('probe', 'temp1',
+         'select distinct _Marker_key, _Refs_key into temp table temp1 from PRB_Marker ',
+         'where'),
 
-        cmd = 'select distinct _Marker_key, _Refs_key into temp table temp1 from PRB_Marker '
-
-        if queryWhere is not None:
-                cmd = cmd + queryWhere;
-
-        db.sql(cmd, None)
-        db.sql('create index idx1 on temp1(_Marker_key)', None)
-        db.sql('create index idx2 on temp1(_Refs_key)', None)
-
-        #
         # Marker History
+        ('history', 'temp4',
+         'select distinct r._Marker_key, r._Refs_key into temp table temp4 from MRK_History r where r._Refs_key is not null',
+         'and'),
 
-        cmd = 'select distinct r._Marker_key, r._Refs_key into temp table temp4 from MRK_History r where r._Refs_key is not null'
-
-        if queryAnd is not None:
-                cmd = cmd + queryAnd
-
-        db.sql(cmd, None)
-        db.sql('create index idx5 on temp4(_Marker_key)', None)
-        db.sql('create index idx6 on temp4(_Refs_key)', None)
-
-        #
         # Mapping
-        #
-
-        cmd = '''
+        ('mapping', 'temp5',
+         '''
                 select distinct em._Marker_key, r._Refs_key 
                 into temp table temp5 
                 from MLD_Expt_Marker em, MLD_Expts r 
                 where em._Expt_key = r._Expt_key
-                '''
-
-        if queryAnd is not None:
-                cmd = cmd + queryAnd
+                ''',
+         'and'),
 
-        db.sql(cmd, None)
-        db.sql('create index idx_temp5_1 on temp5(_Marker_key)', None)
-        db.sql('create index idx_temp5_2 on temp5(_Refs_key)', None)
-
-        #
         # GXD Index
-        #
-
-        cmd = 'select distinct _Marker_key, _Refs_key into temp table temp6 from GXD_Index'
-
-        if queryWhere is not None:
-                cmd = cmd + queryWhere
+        ('gxdindex', 'temp6',
+         'select distinct _Marker_key, _Refs_key into temp table temp6 from GXD_Index',
+         'where'),
 
-        db.sql(cmd, None)
-        db.sql('create index idx7 on temp6(_Marker_key)', None)
-        db.sql('create index idx8 on temp6(_Refs_key)', None)
-
-        #
         # GXD Assay (actually, this should be redundant with GXD_Index)
-        # 
-
-        cmd = 'select distinct _Marker_key, _Refs_key into temp table temp7 from GXD_Assay'
-
-        if queryWhere is not None:
-                cmd = cmd + queryWhere
-
-        db.sql(cmd, None)
-        db.sql('create index idx9 on temp7(_Marker_key)', None)
-        db.sql('create index idx10 on temp7(_Refs_key)', None)
+        ('gxdassay', 'temp7',
+         'select distinct _Marker_key, _Refs_key into temp table temp7 from GXD_Assay',
+         'where'),
 
-        #
         # Marker Synonyms
-        #
-
-        cmd = '''
+        ('synonym', 'temp8',
+         '''
                 select distinct s._Object_key as _Marker_key, s._Refs_key
                 into temp table temp8
                 from MGI_Synonym s, MGI_SynonymType st 
@@ -232,21 +181,13 @@ def process(queryKey, queryWhere, queryAnd, queryAnd2):
                 and s._Refs_key is not null 
                 and s._SynonymType_key = st._SynonymType_key 
                 and st._Organism_key = 1
-                '''
-
-        if queryAnd2 is not None:
-                cmd = cmd + queryAnd2
-
-        db.sql(cmd, None)
-        db.sql('create index idx11 on temp8(_Marker_key)', None)
-        db.sql('create index idx12 on temp8(_Refs_key)', None)
+                ''',
+         'and2'),
 
-        #
         #  Note that this also handles Sequence/Reference associations
         #  indirectly.
-        #
-
-        cmd = '''
+        ('accession', 'temp9',
+         '''
                 select distinct a._Object_key as _Marker_key, ar._Refs_key 
                 into temp table temp9 
                 from MRK_Marker m, ACC_Accession a, ACC_AccessionReference ar 
@@ -255,71 +196,146 @@ def process(queryKey, queryWhere, queryAnd, queryAnd2):
                 and a._MGIType_key = 2 
                 and a.private = 0 
                 and a._Accession_key = ar._Accession_key 
-                '''
-
-        if queryAnd2 is not None:
-                cmd = cmd + queryAnd2
+                ''',
+         'and2'),
 
-        db.sql(cmd, None)
-        db.sql('create index idx13 on temp9(_Marker_key)', None)
-        db.sql('create index idx14 on temp9(_Refs_key)', None)
-
-        #
         # Alleles
-        #
-
-        cmd = '''
+        ('allele', 'temp10',
+         '''
                 select distinct a._Marker_key, r._Refs_key 
                 into temp table temp10 
                 from ALL_Allele a, MGI_Reference_Assoc r 
                 where a._Marker_key is not null 
                 and a._Allele_key = r._Object_key 
                 and r._MGIType_key = 11
-                '''
-
-        if queryAnd is not None:
-                cmd = cmd + queryAnd
+                ''',
+         'and'),
 
-        db.sql(cmd, None)
-        db.sql('create index idx15 on temp10(_Marker_key)', None)
-        db.sql('create index idx16 on temp10(_Refs_key)', None)
-
-        #
         # GO Annotations
-        #
-
-        cmd = '''
+        ('go', 'temp11',
+         '''
                 select distinct a._Object_key as _Marker_key, r._Refs_key 
                 into temp table temp11 
                 from VOC_Annot a, VOC_Evidence r 
                 where a._AnnotType_key = 1000 
                 and a._Annot_key = r._Annot_key 
-                '''
+                ''',
+         'and2'),
 
-        if queryAnd2 is not None:
-                cmd = cmd + queryAnd2
-
-        db.sql(cmd, None)
-        db.sql('create index idx17 on temp11(_Marker_key)', None)
-        db.sql('create index idx18 on temp11(_Refs_key)', None)
-
-        #
         # Curated References
-        #
-
-        cmd = '''
+        ('curated', 'temp12',
+         '''
                 select distinct m._Object_key as _Marker_key, m._Refs_key 
                 into temp table temp12 
                 from MGI_Reference_Assoc m 
                 where m._MGIType_key = 2 
-                '''
+                ''',
+         'and2'),
+        ]
+
+sourceNames = [s[0] for s in sources]
+
+def processAll():
+        global refBCP
+        print('Creating %s.bcp...' % (table))
+        refBCP = mrkcachelib.openOutput(table, outDir)
+        process(None, None, None, None)
+        refBCP.close()
+        db.commit()
+
+def readKeys(args):
+        #
+        # Purpose: the keys given as arguments, or on stdin if there are none
+        # Returns: list of keys (strings)
+        # Assumes:
+        # Effects:
+        # Throws: ValueError if a key is not an integer
+        #
+
+        if len(args) == 0 or args == ['-']:
+                args = sys.stdin.read().split()
 
-        if queryAnd2 is not None:
-                cmd = cmd + queryAnd2
+        keys = []
+        for arg in args:
+                for k in arg.split(','):
+                        if k != '':
+                                keys.append(str(int(k)))
+
+        return keys
+
+def processByMarker(markerKeys):
+        global refBCP
+        keyIn = '(%s)' % (','.join(markerKeys))
+        print('Processed by marker: %d keys' % (len(markerKeys)))
+        refBCP = mrkcachelib.InsertWriter(table)
+        process('_Marker_key in ' + keyIn, ' where _Marker_key in ' + keyIn, ' and _Marker_key in ' + keyIn, ' and _Object_key in ' + keyIn)
+        print('%d rows inserted' % (refBCP.count))
+
+def processByReference(refsKeys):
+        global refBCP
+        keyIn = '(%s)' % (','.join(refsKeys))
+        print('Processed by reference: %d keys' % (len(refsKeys)))
+        refBCP = mrkcachelib.InsertWriter(table)
+        process('_Refs_key in ' + keyIn, ' where _Refs_key in ' + keyIn, ' and r._Refs_key in ' + keyIn, ' and _Refs_key in ' + keyIn)
+        print('%d rows inserted' % (refBCP.count))
+
+def selectSource(source, queryWhere, queryAnd, queryAnd2):
+        #
+        # Purpose: selects the pairs of one source into its temp table
+        # Returns:
+        # Assumes:
+        # Effects: creates the source's temp table and its indexes
+        # Throws:
+        #
+
+        name, temp, cmd, filter = source
+
+        queryFilter = {'where' : queryWhere, 'and' : queryAnd, 'and2' : queryAnd2}[filter]
+
+        if queryFilter is not None:
+                cmd = cmd + queryFilter
 
         db.sql(cmd, None)
-        db.sql('create index idx19 on temp12(_Marker_key)', None)
-        db.sql('create index idx20 on temp12(_Refs_key)', None)
+        db.sql('create index idx_%s_1 on %s(_Marker_key)' % (temp, temp), None)
+        db.sql('create index idx_%s_2 on %s(_Refs_key)' % (temp, temp), None)
+
+def dropSources():
+        for name, temp, cmd, filter in sources:
+                db.sql('drop table if exists %s' % (temp), None)
+
+def process(deleteWhere, queryWhere, queryAnd, queryAnd2):
+        '''
+        #
+        # Create a cache table of
+        # the union of all distinct Marker/Reference pairs
+        # in the database + annotated Reference (MGI_Reference_Assoc)
+        # EXCEPT for MLC.
+        #
+        # Datasets:
+        #
+        # 1.  Molecular Segments
+        # 2.  Orthology
+        # 3.  Marker History
+        # 4.  Mapping
+        # 5.  GXD Index
+        # 6.  GXD Assay
+        # 7.  Synonyms
+        # 8.  Accession Reference
+        # 9.  Allele References
+        # 10. GO Annotations
+        # 11. Manually curated (MGI_Reference_Assoc)
+        #
+        # deleteWhere : None for all markers; else the rows being refreshed,
+        #	which are deleted after the pairs are selected, in the same
+        #	transaction as the inserts
+        #
+        '''
+
+        for source in sources:
+                selectSource(source, queryWhere, queryAnd, queryAnd2)
+
+                if deleteWhere is None and useSnapshot:
+                        saveSnapshot(source[0], readPairs(source[1]), pending = 1)
 
         #
         # union them all together
@@ -339,19 +355,44 @@ def process(queryKey, queryWhere, queryAnd, queryAnd2):
                 ''', None)
         db.sql('create index idx_refs_refs_key on refs(_Refs_key)', None)
 
+        if deleteWhere is not None:
+                db.sql('lock table %s in exclusive mode' % (table), None)
+                db.sql('delete from %s where %s' % (table, deleteWhere), None)
+
+        writeRefs()
+
+        if deleteWhere is not None:
+                refBCP.close()
+
+        dropSources()
+        db.sql('drop table if exists refs', None)
+
+        db.commit()
+
+def writeRefs():
+        #
+        # Purpose: writes a row for each pair in the refs temp table
+        # Returns:
+        # Assumes: refBCP is open
+        # Effects: writes to refBCP
+        # Throws:
+        #
+        # A pair whose reference has no J: is skipped.
+        #
+
         mgiID = {}
         jnumID = {}
         jnum = {}
         pubmedID = {}
 
-        results = db.sql('''
+        results = mrkcachelib.streamSql('''
                 select r._Refs_key, a._LogicalDB_key, a.prefixPart, a.numericPart, a.accID
                 from refs r, ACC_Accession a
                 where r._Refs_key = a._Object_key
                 and a._MGIType_key = 1
                 and a._LogicalDB_key in (1, 29)
                 and a.preferred = 1
-                ''', 'auto')
+                ''')
         for r in results:
             key = r['_Refs_key']
             value = r['accID']
@@ -367,8 +408,7 @@ def process(queryKey, queryWhere, queryAnd, queryAnd2):
             else:
                 pubmedID[key] = value
 
-        results = db.sql('select _Marker_key, _Refs_key from refs', 'auto')
-        insertSQL = ""
+        results = mrkcachelib.streamSql('select _Marker_key, _Refs_key from refs')
         for r in results:
             key = r['_Refs_key']
 
@@ -376,45 +416,190 @@ def process(queryKey, queryWhere, queryAnd, queryAnd2):
             if key not in jnumID:
                 continue
 
-            if (queryKey == None):
-                refBCP.write(mgi_utils.prvalue(r['_Marker_key']) + COLDL + \
-                        mgi_utils.prvalue(key) + COLDL + \
-                        mgi_utils.prvalue(mgiID[key]) + COLDL + \
-                        mgi_utils.prvalue(jnumID[key]) + COLDL)
+            if key in pubmedID:
+                    p = mgi_utils.prvalue(pubmedID[key])
+            else:
+                    p = ''
+
+            refBCP.write(mgi_utils.prvalue(r['_Marker_key']) + COLDL + \
+                    mgi_utils.prvalue(key) + COLDL + \
+                    mgi_utils.prvalue(mgiID[key]) + COLDL + \
+                    mgi_utils.prvalue(jnumID[key]) + COLDL + \
+                    p + COLDL + \
+                    mgi_utils.prvalue(jnum[key]) + COLDL + \
+                    cdate + COLDL + \
+                    cdate + LINEDL)
+
+def readPairs(temp):
+        #
+        # Purpose: reads the pairs of a temp table
+        # Returns: array of pairs (see encodePair()), sorted
+        #
 
-                if key in pubmedID:
-                        refBCP.write(mgi_utils.prvalue(pubmedID[key]))
+        pairs = array('Q')
+        for r in mrkcachelib.streamSql('select _Marker_key, _Refs_key from %s order by _Marker_key, _Refs_key' % (temp)):
+                pairs.append(encodePair(r['_Marker_key'], r['_Refs_key']))
+        return pairs
 
-                refBCP.write(COLDL + mgi_utils.prvalue(jnum[key]) + COLDL + \
-                        cdate + COLDL + \
-                        cdate + LINEDL)
+def encodePair(markerKey, refsKey):
+        return (int(markerKey) << 32) | int(refsKey)
 
-                refBCP.flush()
+def decodePair(pair):
+        return (pair >> 32, pair & 0xffffffff)
 
-            else:
-                if key in pubmedID:
-                        p = "'" + pubmedID[key] + "'"
+def snapshotPath(name):
+        return '%s/%s.%s.snapshot' % (outDir, table, name)
+
+def saveSnapshot(name, pairs, pending = 0):
+        #
+        # Purpose: saves the pairs of one source, for a later processBySource()
+        #
+        # pending : the pairs are not in MRK_Reference yet; write them to
+        #	    <snapshot>.pending, for mrkcacheapply.csh to rename once
+        #	    they are
+        #
+
+        path = snapshotPath(name)
+        if pending:
+                path = path + '.pending'
+        fp = open(path + '.tmp', 'wb')
+        pairs.tofile(fp)
+        fp.close()
+        os.rename(path + '.tmp', path)
+
+def readSnapshot(name):
+        #
+        # Purpose: reads the pairs of one source saved by an earlier load
+        # Returns: array of pairs, sorted; None if there is no snapshot
+        #
+
+        path = snapshotPath(name)
+        if not os.path.exists(path):
+                return None
+
+        pairs = array('Q')
+        fp = open(path, 'rb')
+        pairs.fromfile(fp, os.path.getsize(path) // pairs.itemsize)
+        fp.close()
+        return pairs
+
+def diffPairs(old, new):
+        #
+        # Purpose: compares two sorted arrays of pairs
+        # Returns: (pairs only in new, pairs only in old)
+        #
+
+        added = []
+        removed = []
+        i = 0
+        j = 0
+
+        while i < len(old) or j < len(new):
+                if j == len(new) or (i < len(old) and old[i] < new[j]):
+                        removed.append(old[i])
+                        i = i + 1
+                elif i == len(old) or new[j] < old[i]:
+                        added.append(new[j])
+                        j = j + 1
                 else:
-                        p = 'null'
-
-                insertSQL = '''insert into MRK_Reference values(%s,%s,'%s','%s',%s,'%s',now(),now());\n''' \
-                        % (r['_Marker_key'], key, mgiID[key], jnumID[key], p, jnum[key])
-                db.sql(insertSQL, None)
-                db.commit()
-
-        db.sql('drop table if exists temp1', None)
-        db.sql('drop table if exists temp4', None)
-        db.sql('drop table if exists temp5', None)
-        db.sql('drop table if exists temp6', None)
-        db.sql('drop table if exists temp7', None)
-        db.sql('drop table if exists temp8', None)
-        db.sql('drop table if exists temp9', None)
-        db.sql('drop table if exists temp10', None)
-        db.sql('drop table if exists temp11', None)
-        db.sql('drop table if exists temp12', None)
+                        i = i + 1
+                        j = j + 1
+
+        return added, removed
+
+def processBySource(name):
+        #
+        # Purpose: refreshes MRK_Reference after one source has changed
+        # Returns:
+        # Assumes: a full load has saved the source's snapshot
+        # Effects: inserts/deletes MRK_Reference rows in one transaction;
+        #          saves the source's new snapshot
+        # Throws:
+        #
+        # Only the pairs that entered or left the source since its snapshot
+        # are looked at, and of those only the ones that no other source
+        # has (for their markers, the other sources are selected again)
+        # are inserted or deleted: the others' membership in the union has
+        # not changed.  An inserted pair is deleted first, so a pair that
+        # a by-marker/by-reference refresh has already added since the
+        # snapshot is not duplicated.
+        #
+
+        global refBCP
+
+        source = sources[sourceNames.index(name)]
+        print('Processed by source: %s' % (name))
+
+        old = readSnapshot(name)
+        if old is None:
+                sys.stderr.write('no snapshot of source %s (%s); run mrkref.py first\n' % (name, snapshotPath(name)))
+                sys.exit(1)
+
+        selectSource(source, None, None, None)
+        new = readPairs(source[1])
+        added, removed = diffPairs(old, new)
+        print('%d pairs added, %d pairs removed' % (len(added), len(removed)))
+
+        # the pairs the other sources have, for the changed markers
+
+        others = set()
+        markerKeys = sorted(set([str(decodePair(p)[0]) for p in added + removed]))
+
+        if len(markerKeys) > 0:
+                keyIn = '(%s)' % (','.join(markerKeys))
+                otherSources = [s for s in sources if s[0] != name]
+
+                for s in otherSources:
+                        selectSource(s, ' where _Marker_key in ' + keyIn, ' and _Marker_key in ' + keyIn, ' and _Object_key in ' + keyIn)
+                        for p in readPairs(s[1]):
+                                others.add(p)
+
+        added = [p for p in added if p not in others]
+        removed = [p for p in removed if p not in others]
+        print('%d rows to insert, %d rows to delete' % (len(added), len(removed)))
+
+        # the changed pairs: refs (to insert) and changed (to delete)
+
+        db.sql('create temporary table refs (_Marker_key int, _Refs_key int)', None)
+        db.sql('create temporary table changed (_Marker_key int, _Refs_key int)', None)
+
+        refBCP = mrkcachelib.InsertWriter('refs')
+        changedBCP = mrkcachelib.InsertWriter('changed')
+
+        for p in added:
+                markerKey, refsKey = decodePair(p)
+                refBCP.write('%s%s%s%s' % (markerKey, COLDL, refsKey, LINEDL))
+                changedBCP.write('%s%s%s%s' % (markerKey, COLDL, refsKey, LINEDL))
+
+        for p in removed:
+                markerKey, refsKey = decodePair(p)
+                changedBCP.write('%s%s%s%s' % (markerKey, COLDL, refsKey, LINEDL))
+
+        refBCP.close()
+        changedBCP.close()
+        db.sql('create index idx_refs_refs_key on refs(_Refs_key)', None)
+
+        db.sql('lock table %s in exclusive mode' % (table), None)
+        db.sql('''delete from %s r using changed c
+                where r._Marker_key = c._Marker_key
+                and r._Refs_key = c._Refs_key
+                ''' % (table), None)
+
+        refBCP = mrkcachelib.InsertWriter(table)
+        writeRefs()
+        refBCP.close()
+
+        dropSources()
+        db.sql('drop table if exists refs', None)
+        db.sql('drop table if exists changed', None)
 
         db.commit()
 
+        # the table now reflects the source's current pairs
+        saveSnapshot(name, new)
+
+        print('%d rows inserted' % (refBCP.count))
+
 #
 # Main Routine
 #
@@ -426,15 +611,39 @@ if __name__ == '__main__':
 
         if scriptName == "mrkref.py":
                 #db.setTrace(True)
-                processAll();
+                try:
+                        optlist, args = getopt.getopt(sys.argv[1:], 's:')
+                except:
+                        optlist = [('-h', '')]
+
+                sourceName = None
+                for opt in optlist:
+                        if opt[0] == '-s' and opt[1] in sourceNames:
+                                sourceName = opt[1]
+                        else:
+                                sys.stderr.write('usage: %s [-s %s]\n' % (sys.argv[0], '|'.join(sourceNames)))
+                                sys.exit(1)
+
+                if sourceName is None:
+                        processAll();
+                else:
+                        processBySource(sourceName)
 
         elif scriptName == "mrkrefByMarker.py":
                 #db.setTrace(True)
-                processByMarker(sys.argv[1])
+                markerKeys = readKeys(sys.argv[1:])
+                if len(markerKeys) == 0:
+                        print('No markers to process')
+                else:
+                        processByMarker(markerKeys)
 
         elif scriptName == "mrkrefByReference.py":
                 #db.setTrace(True)
-                processByReference(sys.argv[1])
+                refsKeys = readKeys(sys.argv[1:])
+                if len(refsKeys) == 0:
+                        print('No references to process')
+                else:
+                        processByReference(refsKeys)
 
         sys.exit()
         #print('%s' % mgi_utils.date())